@@ -0,0 +1,569 @@
+"""
+async_chat_functions.py
+
+This module provides an asynchronous version of the `get_answer` pipeline of chat_functions.py, so the
+FastAPI backend can serve many concurrent requests from one event loop instead of pinning a worker thread
+per request for the duration of every LLM and Elasticsearch round trip.
+
+Network calls go through AsyncOpenAI and AsyncElasticsearch clients. Query bodies, prompts, caches and the
+in-process snapshot are shared with chat_functions.py. CPU bound work, the micro-batched query embedding
+and local snapshot searches, runs off the event loop.
+
+Functions:
+- embed_query: Embeds a query, reusing cached embeddings of previously seen queries.
+- elastic_search_text: Searches for text matches in an Elasticsearch index.
+- elastic_search_knn: Performs a k-NN search in an Elasticsearch index.
+- elastic_search_hybrid: Combines k-NN and keyword search in one Elasticsearch query.
+- elastic_search_rrf: Runs vector and text searches concurrently and fuses them with Reciprocal Rank Fusion.
+- search_documents: Runs a search on the configured SEARCH_BACKEND, falling back to the snapshot if Elasticsearch fails.
+- llm: Sends a prompt to a language model and retrieves the response, token usage, and response time.
+- llm_stream: Sends a prompt to a language model and yields the response as it is generated.
+- evaluate_relevance: Evaluates the relevance of a generated answer to a given question.
+- improve_query: Rewrites a user's query for clarity, spelling and grammar.
+- rewrite_query: Rewrites a query with `improve_query` unless it is well formed or was rewritten before.
+- rewrite_and_search: Rewrites a query and retrieves its context, speculatively searching the raw query meanwhile.
+- get_answer: Retrieves an answer to a query by performing a search and evaluating the response.
+- stream_answer: Retrieves an answer like `get_answer`, yielding the answer text as it is generated.
+- close_clients: Closes the asynchronous clients on shutdown.
+
+Dependencies:
+- chat_functions (for configuration, query bodies, prompts, caches and the local snapshot)
+- llm_clients (for the pooled HTTP clients of the LLM providers)
+- aiohttp (required by AsyncElasticsearch)
+"""
+
+import time
+import uuid
+import asyncio
+import numpy as np
+from dotenv import load_dotenv
+
+from openai import AsyncOpenAI
+from elasticsearch import ApiError, AsyncElasticsearch, TransportError
+from typing import List, Dict, Tuple, Any, Optional, AsyncIterator, Callable
+
+from llm_clients import OLLAMA_URL, OPENAI_API_KEY, get_async_http_client
+
+from chat_functions import (
+    ELASTIC_URL, MODEL_NAME, INDEX_NAME, SEARCH_K, KNN_NUM_CANDIDATES,
+    RRF_RANK_CONSTANT, RRF_WINDOW_SIZE, RRF_NUM_CANDIDATES, SEARCH_BACKEND, ES_SEARCH_TIMEOUT, RELEVANCE_EVAL_MODE,
+    embedding_batcher, query_embedding_cache, normalize_query, text_search_query, knn_search_query,
+    hybrid_search_query, reciprocal_rank_fusion, resolve_search_settings, can_fall_back, run_search, build_prompt,
+    build_evaluation_prompt, parse_evaluation, build_rewrite_prompt, build_answer_data, grade_answer,
+    answer_cache, lookup_cached_answer, cache_answer, cache_when_graded, query_rewrite_cache, plan_rewrite, REWRITE_MODEL,
+    SPECULATIVE_RETRIEVAL, speculation_holds,
+)
+
+
+load_dotenv()
+
+async_es_client = AsyncElasticsearch(ELASTIC_URL, request_timeout=ES_SEARCH_TIMEOUT)
+async_ollama_client = AsyncOpenAI(base_url=OLLAMA_URL, api_key="ollama", http_client=get_async_http_client("ollama"))
+async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=get_async_http_client("openai"))
+
+
+async def embed_query(query: str) -> np.ndarray:
+    """
+    Embeds a query like `chat_functions.embed_query`, waiting for the micro-batching encoder without
+    blocking the event loop.
+
+    Args:
+        query (str): The query string.
+
+    Returns:
+        np.ndarray: The query vector. It is shared with the cache and must not be modified.
+    """
+    normalized = normalize_query(query)
+    key = (MODEL_NAME, normalized)
+
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        vector = await asyncio.wrap_future(embedding_batcher.submit(normalized))
+        vector.setflags(write=False)
+        query_embedding_cache.set(key, vector)
+    return vector
+
+
+async def elastic_search_text(query: str, index_name: str = INDEX_NAME, size: int = SEARCH_K) -> List[Dict[str, Any]]:
+    """
+    Searches for text in the specified Elasticsearch index based on the query.
+
+    Args:
+        query (str): The search query string.
+        index_name (str): The name of the Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        size (int): The number of results to return. Defaults to SEARCH_K.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+    """
+    response = await async_es_client.search(index=index_name, body=text_search_query(query, size))
+    return [hit["_source"] for hit in response["hits"]["hits"]]
+
+
+async def elastic_search_knn(
+    field: str,
+    vector: List[float],
+    index_name: str = INDEX_NAME,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a k-nearest neighbor (k-NN) search in the specified Elasticsearch index based on a query vector.
+
+    Args:
+        field (str): The field name in the index where the vector is stored.
+        vector (List[float]): The query vector for which to find the nearest neighbors.
+        index_name (str): The name of the Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        k (int): The number of nearest neighbors to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of candidates considered per shard. Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+    """
+    response = await async_es_client.search(index=index_name, body=knn_search_query(field, vector, k, num_candidates))
+    return [hit["_source"] for hit in response["hits"]["hits"]]
+
+
+async def elastic_search_hybrid(
+    field: str,
+    query: str,
+    vector: List[float],
+    index_name: str = INDEX_NAME,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a hybrid search on Elasticsearch combining k-NN vector search and keyword matching.
+
+    Args:
+        field (str): The field to use for the k-NN search.
+        query (str): The keyword query string.
+        vector (List[float]): The query vector for k-NN search.
+        index_name (str): The Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        k (int): The number of nearest neighbors and of results to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered per shard. Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents from Elasticsearch.
+    """
+    search_query = hybrid_search_query(field, query, vector, k, num_candidates)
+    response = await async_es_client.search(index=index_name, body=search_query)
+    return [hit["_source"] for hit in response["hits"]["hits"]]
+
+
+async def elastic_search_rrf(
+    field: str,
+    query: str,
+    vector: List[float],
+    index_name: str = INDEX_NAME,
+    size: int = SEARCH_K,
+    rank_constant: int = RRF_RANK_CONSTANT,
+    window_size: int = RRF_WINDOW_SIZE,
+    num_candidates: int = RRF_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a hybrid search that fuses separate k-NN and keyword searches with Reciprocal Rank Fusion.
+
+    Both searches run concurrently on the event loop, see `chat_functions.elastic_search_rrf`.
+
+    Args:
+        field (str): The field to use for the k-NN search.
+        query (str): The keyword query string.
+        vector (List[float]): The query vector for k-NN search.
+        index_name (str): The Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        size (int): The number of fused results to return. Defaults to SEARCH_K.
+        rank_constant (int): The RRF rank constant. Defaults to RRF_RANK_CONSTANT.
+        window_size (int): The number of results taken from each search. Defaults to RRF_WINDOW_SIZE.
+        num_candidates (int): The number of k-NN candidates considered per shard. Defaults to RRF_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents from Elasticsearch.
+    """
+    knn_results, text_results = await asyncio.gather(
+        elastic_search_knn(field, vector, index_name, window_size, max(num_candidates, window_size)),
+        elastic_search_text(query, index_name, window_size),
+    )
+    return reciprocal_rank_fusion([knn_results, text_results], size, rank_constant)
+
+
+async def _run_elastic_search(search_type: str, query: str, k: int, num_candidates: int) -> List[Dict[str, Any]]:
+    if search_type == 'Vector':
+        return await elastic_search_knn('question_vector', await embed_query(query), k=k, num_candidates=num_candidates)
+    if search_type == 'Hybrid':
+        vector = await embed_query(query)
+        return await elastic_search_hybrid('question_vector', query, vector, k=k, num_candidates=num_candidates)
+    if search_type == 'RRF':
+        vector = await embed_query(query)
+        return await elastic_search_rrf(
+            'question_vector', query, vector, size=k, num_candidates=num_candidates,
+            window_size=max(RRF_WINDOW_SIZE, k)
+        )
+    return await elastic_search_text(query, size=k)
+
+
+async def _run_local_search(search_type: str, query: str, k: int, num_candidates: int) -> List[Dict[str, Any]]:
+    if search_type in ('Vector', 'Hybrid', 'RRF'):
+        await embed_query(query)  # Encode on the batcher here, so the worker thread only hits the cache
+    return await asyncio.to_thread(run_search, search_type, query, k, num_candidates, True)
+
+
+async def search_documents(
+    search_type: str,
+    query: str,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Retrieves the context documents for a query like `chat_functions.search_documents`.
+
+    Args:
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        query (str): The query string.
+        k (int): The number of documents to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents.
+    """
+    if SEARCH_BACKEND == "local":
+        return await _run_local_search(search_type, query, k, num_candidates)
+
+    try:
+        return await _run_elastic_search(search_type, query, k, num_candidates)
+    except (TransportError, ApiError) as e:
+        if not can_fall_back(e):
+            raise
+        print(f"Elasticsearch search failed ({e!r}), answering from the local snapshot")
+        return await _run_local_search(search_type, query, k, num_candidates)
+
+
+def _get_client(model_choice: str) -> AsyncOpenAI:
+    if model_choice.startswith('ollama/'):
+        return async_ollama_client
+    if model_choice.startswith(('openai/', 'aws_bedrock/')):
+        return async_openai_client
+    raise ValueError(f"Unknown model choice: {model_choice}")
+
+
+async def llm(prompt: str, model_choice: str) -> Tuple[str, Dict[str, int], float]:
+    """
+    Sends a prompt to a specified language model and retrieves the response, token usage, and response time.
+
+    Supports the same model choices as `llm_clients.llm`. Raises a ValueError for unknown model choices.
+
+    Args:
+        prompt (str): The input prompt to send to the language model.
+        model_choice (str): The identifier for the model to use. Should start with 'ollama/' or 'openai/'.
+
+    Returns:
+        Tuple[str, Dict[str, int], float]: The response content, the 'prompt_tokens', 'completion_tokens'
+        and 'total_tokens' used, and the response time in seconds.
+    """
+    start_time = time.time()
+
+    client = _get_client(model_choice)
+    response = await client.chat.completions.create(
+        model=model_choice.split('/')[-1],
+        messages=[{"role": "user", "content": prompt}]
+    )
+
+    answer = response.choices[0].message.content
+    tokens = {
+        'prompt_tokens': response.usage.prompt_tokens,
+        'completion_tokens': response.usage.completion_tokens,
+        'total_tokens': response.usage.total_tokens
+    }
+
+    return answer, tokens, time.time() - start_time
+
+
+async def llm_stream(prompt: str, model_choice: str, stats: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Sends a prompt to a specified language model and yields the response in pieces as they are generated.
+
+    The token usage is requested with the final chunk of the stream. Providers that do not report usage
+    for streamed completions leave the token counts at zero.
+
+    Args:
+        prompt (str): The input prompt to send to the language model.
+        model_choice (str): The identifier for the model to use. Should start with 'ollama/' or 'openai/'.
+        stats (Dict[str, Any]): Filled in once the stream is exhausted with the 'answer', the 'tokens' used
+            and the 'response_time' in seconds.
+
+    Yields:
+        str: The next piece of the response content.
+    """
+    start_time = time.time()
+    parts = []
+    tokens = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+
+    stream = await _get_client(model_choice).chat.completions.create(
+        model=model_choice.split('/')[-1],
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                tokens = {
+                    'prompt_tokens': chunk.usage.prompt_tokens,
+                    'completion_tokens': chunk.usage.completion_tokens,
+                    'total_tokens': chunk.usage.total_tokens
+                }
+    finally:
+        await stream.close()  # Release the connection if the client went away mid answer
+
+    stats.update(answer="".join(parts), tokens=tokens, response_time=time.time() - start_time)
+
+
+async def evaluate_relevance(question: str, answer: str) -> Tuple[str, str, Dict[str, int]]:
+    """
+    Evaluates the relevance of a generated answer to a given question, see `chat_functions.evaluate_relevance`.
+
+    Args:
+        question (str): The question to which the answer was generated.
+        answer (str): The generated answer to evaluate.
+
+    Returns:
+        Tuple[str, str, Dict[str, int]]: The relevance classification, a brief explanation and the token usage.
+    """
+    evaluation, tokens, _ = await llm(build_evaluation_prompt(question, answer), 'openai/gpt-4o-mini')
+    relevance, explanation = parse_evaluation(evaluation)
+    return relevance, explanation, tokens
+
+
+async def improve_query(user_query: str, model: str = 'openai/gpt-4o-mini') -> str:
+    """
+    Rewrites a user's query to fix spelling and grammar and improve clarity, see `chat_functions.improve_query`.
+
+    Args:
+        user_query (str): The original query from the user.
+        model (str): The model used for the rewrite. Defaults to 'openai/gpt-4o-mini'.
+
+    Returns:
+        str: The improved query.
+    """
+    improved_query, _, _ = await llm(build_rewrite_prompt(user_query), model)
+    return improved_query
+
+
+async def rewrite_query(query: str, rewrite: Optional[bool] = None) -> str:
+    """
+    Rewrites a query like `chat_functions.rewrite_query`.
+
+    Args:
+        query (str): The query string.
+        rewrite (Optional[bool]): False to never rewrite, True to rewrite even well formed queries.
+            Defaults to None, see `chat_functions.plan_rewrite`.
+
+    Returns:
+        str: The query to search with.
+    """
+    # The gate reads the snapshot vocabulary, which may load or wait for a reload of the snapshot
+    rewritten, key = await asyncio.to_thread(plan_rewrite, query, rewrite)
+    if rewritten is None:
+        rewritten = await improve_query(query, REWRITE_MODEL)
+        query_rewrite_cache.set(key, rewritten)
+    return rewritten
+
+
+async def rewrite_and_search(
+    query: str,
+    search_type: str,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES,
+    rewrite: Optional[bool] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Rewrites a query and retrieves the context documents like `chat_functions.rewrite_and_search`, running
+    the speculative search on the raw query as a concurrent task.
+
+    Args:
+        query (str): The raw query string.
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        k (int): The number of documents to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to KNN_NUM_CANDIDATES.
+        rewrite (Optional[bool]): Whether to rewrite the query, see `chat_functions.plan_rewrite`. Defaults to None.
+
+    Returns:
+        Tuple[str, List[Dict[str, Any]]]: The rewritten query and the search result documents.
+    """
+    # The gate reads the snapshot vocabulary, which may load or wait for a reload of the snapshot
+    rewritten, key = await asyncio.to_thread(plan_rewrite, query, rewrite)
+    speculative = None
+    if rewritten is None:
+        if SPECULATIVE_RETRIEVAL:
+            speculative = asyncio.create_task(search_documents(search_type, query, k, num_candidates))
+            # A discarded search may fail unobserved, retrieve its error so it is not reported as unhandled
+            speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+        rewritten = await improve_query(query, REWRITE_MODEL)
+        query_rewrite_cache.set(key, rewritten)
+
+    if speculative is not None:
+        # Text search never needs the embeddings, compare the terms of the queries instead
+        vectors = () if search_type == 'Text' else (await embed_query(query), await embed_query(rewritten))
+        if speculation_holds(query, rewritten, *vectors):
+            return rewritten, await speculative
+        speculative.cancel()
+    return rewritten, await search_documents(search_type, rewritten, k, num_candidates)
+
+
+async def _grade_answer(
+    answer_id: str,
+    question: str,
+    answer: str,
+    defer_evaluation: Optional[bool],
+    on_evaluated: Optional[Callable[[str, str, Dict[str, int]], None]] = None
+) -> Tuple[str, str, Dict[str, int]]:
+    if defer_evaluation is None:
+        defer_evaluation = RELEVANCE_EVAL_MODE == "deferred"
+    if defer_evaluation:
+        # Only queues the answer, the background worker evaluates it
+        return grade_answer(answer_id, question, answer, True, on_evaluated)
+    return await evaluate_relevance(question, answer)
+
+
+async def get_answer(
+    query: str,
+    model_choice: str,
+    search_type: str,
+    k: Optional[int] = None,
+    num_candidates: Optional[int] = None,
+    defer_evaluation: Optional[bool] = None,
+    rewrite: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Retrieves an answer to a query by performing a search and evaluating the response, with the same
+    arguments, answer data and semantic answer cache as `chat_functions.get_answer`.
+
+    Args:
+        query (str): The query for which an answer is sought.
+        model_choice (str): The identifier for the model used to generate the answer.
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        k (Optional[int]): The number of documents retrieved as context. Defaults to SEARCH_K.
+        num_candidates (Optional[int]): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to RRF_NUM_CANDIDATES for RRF search and KNN_NUM_CANDIDATES otherwise.
+        defer_evaluation (Optional[bool]): Whether to return before the relevance is evaluated, see
+            `chat_functions.grade_answer`. Defaults to RELEVANCE_EVAL_MODE being 'deferred'.
+        rewrite (Optional[bool]): Whether to rewrite the query first, see `rewrite_query`. Defaults to None,
+            rewriting only queries that are not well formed.
+
+    Returns:
+        Dict[str, Any]: The answer, its evaluation, token usage and cost, see `chat_functions.get_answer`.
+    """
+    start_time = time.time()
+    k, num_candidates = resolve_search_settings(search_type, k, num_candidates)
+
+    # Reuse the answer to a similar earlier question, keyed by the raw query so the rewrite is skipped too
+    scope = (model_choice, search_type, k, num_candidates)
+    query_vector = await embed_query(query) if answer_cache.enabled else None
+    if query_vector is not None:
+        cached = lookup_cached_answer(query_vector, scope, start_time)
+        if cached is not None:
+            return cached
+
+    # first clean the query to improve spelling and grammar and clarity, unless it is clean already,
+    # then search for the best matching knowledge base
+    query, search_results = await rewrite_and_search(query, search_type, k, num_candidates, rewrite)
+
+    answer, tokens, response_time = await llm(build_prompt(query, search_results), model_choice)
+
+    answer_id = uuid.uuid4().hex
+    on_evaluated = cache_when_graded(query_vector, scope, answer, response_time, model_choice, tokens, answer_id)
+    relevance, explanation, eval_tokens = await _grade_answer(answer_id, query, answer, defer_evaluation, on_evaluated)
+
+    answer_data = build_answer_data(
+        answer, response_time, relevance, explanation, model_choice, tokens, eval_tokens, answer_id
+    )
+    if query_vector is not None:
+        cache_answer(query_vector, scope, answer_data)
+    return answer_data
+
+
+async def stream_answer(
+    query: str,
+    model_choice: str,
+    search_type: str,
+    k: Optional[int] = None,
+    num_candidates: Optional[int] = None,
+    defer_evaluation: Optional[bool] = None,
+    rewrite: Optional[bool] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Retrieves an answer to a query like `get_answer`, but yields the answer text while the language model
+    generates it, so it can be shown from the first token on.
+
+    The relevance is evaluated once the answer is complete. An answer from the semantic answer cache is
+    yielded as a single piece.
+
+    Args:
+        query (str): The query for which an answer is sought.
+        model_choice (str): The identifier for the model used to generate the answer.
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        k (Optional[int]): The number of documents retrieved as context. Defaults to SEARCH_K.
+        num_candidates (Optional[int]): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to RRF_NUM_CANDIDATES for RRF search and KNN_NUM_CANDIDATES otherwise.
+        defer_evaluation (Optional[bool]): Whether to skip waiting for the relevance evaluation, see
+            `chat_functions.grade_answer`. Defaults to RELEVANCE_EVAL_MODE being 'deferred'.
+        rewrite (Optional[bool]): Whether to rewrite the query first, see `rewrite_query`. Defaults to None.
+
+    Yields:
+        Tuple[str, Any]: ('token', piece) for every piece of the answer text, then ('answer', answer_data)
+        with the answer data of `get_answer` and the 'first_token_time', the seconds from the request to the
+        first piece of the answer.
+    """
+    start_time = time.time()
+    k, num_candidates = resolve_search_settings(search_type, k, num_candidates)
+
+    scope = (model_choice, search_type, k, num_candidates)
+    query_vector = await embed_query(query) if answer_cache.enabled else None
+    if query_vector is not None:
+        cached = lookup_cached_answer(query_vector, scope, start_time)
+        if cached is not None:
+            first_token_time = time.time() - start_time
+            yield 'token', cached['answer']
+            yield 'answer', {**cached, 'first_token_time': first_token_time}
+            return
+
+    query, search_results = await rewrite_and_search(query, search_type, k, num_candidates, rewrite)
+
+    stats = {}
+    first_token_time = None
+    async for piece in llm_stream(build_prompt(query, search_results), model_choice, stats):
+        if first_token_time is None:
+            first_token_time = time.time() - start_time
+        yield 'token', piece
+
+    answer_id = uuid.uuid4().hex
+    on_evaluated = cache_when_graded(
+        query_vector, scope, stats['answer'], stats['response_time'], model_choice, stats['tokens'], answer_id
+    )
+    relevance, explanation, eval_tokens = await _grade_answer(
+        answer_id, query, stats['answer'], defer_evaluation, on_evaluated
+    )
+
+    answer_data = build_answer_data(
+        stats['answer'], stats['response_time'], relevance, explanation, model_choice, stats['tokens'],
+        eval_tokens, answer_id
+    )
+    if query_vector is not None:
+        cache_answer(query_vector, scope, answer_data)
+    yield 'answer', {**answer_data, 'first_token_time': first_token_time or time.time() - start_time}
+
+
+async def close_clients() -> None:
+    """
+    Closes the connection pools of the asynchronous clients.
+
+    Returns:
+        None
+    """
+    await async_es_client.close()
+    await async_openai_client.close()
+    await async_ollama_client.close()
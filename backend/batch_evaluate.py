@@ -0,0 +1,219 @@
+"""
+batch_evaluate.py
+
+This script grades the relevance of saved answers offline, for answers returned with a deferred
+evaluation that the background worker did not grade, or for whole days of traffic graded in bulk.
+
+Ungraded conversations are read from the 'conversations' table and packed several at a time into a
+single evaluation prompt, so the instructions are paid for once per batch instead of once per answer.
+Batches are graded with bounded concurrency and the results are written back in one statement per
+page of conversations. The evaluation tokens of a batch are split evenly between its answers.
+
+Answers the evaluator model did not grade keep their relevance and are picked up by the next run.
+
+Usage:
+    python batch_evaluate.py --batch-size 10 --concurrency 4
+
+Dependencies:
+    - llm_clients (for the language model call)
+    - database (for reading and updating conversations)
+"""
+
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llm_clients import llm
+from database import get_ungraded_conversations, update_relevances
+
+
+EVALUATION_MODEL = "openai/gpt-4o-mini"
+RELEVANCE_VALUES = ("NON_RELEVANT", "PARTLY_RELEVANT", "RELEVANT")
+
+
+def build_batch_evaluation_prompt(conversations: List[Dict[str, Any]]) -> str:
+    """
+    Builds one prompt asking the evaluator model to grade several question and answer pairs.
+
+    Args:
+        conversations (List[Dict[str, Any]]): The conversations to grade, each with 'question' and 'answer'.
+
+    Returns:
+        str: The evaluation prompt. The pairs are numbered from 0 in the given order.
+    """
+    prompt_template = """
+    You are an expert evaluator for a Retrieval-Augmented Generation (RAG) system.
+    Your task is to analyze the relevance of each generated answer to its question.
+    Based on the relevance of each generated answer, you will classify it
+    as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
+
+    Here is the data for evaluation, one numbered question and generated answer pair per entry:
+
+    {pairs}
+
+    Please analyze every pair independently and provide your evaluation in parsable JSON without
+    using code blocks, as a list with one object per pair:
+
+    [
+      {{
+        "Id": [the number of the pair],
+        "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+        "Explanation": "[Provide a brief explanation for your evaluation]"
+      }}
+    ]
+    """.strip()
+
+    pairs = "\n\n".join(
+        f"Id: {number}\nQuestion: {conversation['question']}\nGenerated Answer: {conversation['answer']}"
+        for number, conversation in enumerate(conversations)
+    )
+    return prompt_template.format(pairs=pairs)
+
+
+def parse_batch_evaluation(evaluation: str, count: int) -> Dict[int, Tuple[str, str]]:
+    """
+    Parses the JSON reply to a batch evaluation prompt.
+
+    Args:
+        evaluation (str): The reply of the evaluator model.
+        count (int): The number of pairs in the prompt.
+
+    Returns:
+        Dict[int, Tuple[str, str]]: The relevance and explanation by pair number, for the pairs that
+        were graded with a valid relevance.
+    """
+    try:
+        items = json.loads(evaluation)
+    except json.JSONDecodeError:
+        return {}
+
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            number, relevance = int(item["Id"]), item["Relevance"]
+        except (TypeError, KeyError, ValueError):
+            continue
+        if 0 <= number < count and relevance in RELEVANCE_VALUES:
+            results[number] = (relevance, str(item.get("Explanation", "")))
+    return results
+
+
+def split_tokens(tokens: Dict[str, int], parts: int) -> List[Tuple[int, int, int]]:
+    """
+    Splits the token usage of a batch evenly between its answers.
+
+    Args:
+        tokens (Dict[str, int]): The 'prompt_tokens', 'completion_tokens' and 'total_tokens' of the batch.
+        parts (int): The number of answers.
+
+    Returns:
+        List[Tuple[int, int, int]]: The prompt, completion and total tokens of every answer.
+    """
+    shares = []
+    for part in range(parts):
+        prompt_tokens = tokens["prompt_tokens"] // parts + (part < tokens["prompt_tokens"] % parts)
+        completion_tokens = tokens["completion_tokens"] // parts + (part < tokens["completion_tokens"] % parts)
+        shares.append((prompt_tokens, completion_tokens, prompt_tokens + completion_tokens))
+    return shares
+
+
+def evaluate_batch(conversations: List[Dict[str, Any]]) -> List[Tuple[Optional[str], str, str, str, int, int, int]]:
+    """
+    Grades a batch of conversations with one evaluator call.
+
+    Args:
+        conversations (List[Dict[str, Any]]): The conversations, each with 'answer_id', 'row_id', 'question'
+            and 'answer'.
+
+    Returns:
+        List[Tuple[Optional[str], str, str, str, int, int, int]]: The evaluations of the graded conversations in the
+        format of `database.update_relevances`.
+    """
+    try:
+        evaluation, tokens, _ = llm(build_batch_evaluation_prompt(conversations), EVALUATION_MODEL)
+    except Exception as e:
+        print(f"Evaluating a batch of {len(conversations)} answers failed: {e!r}")
+        return []
+
+    results = parse_batch_evaluation(evaluation, len(conversations))
+    shares = split_tokens(tokens, max(1, len(results)))
+    return [
+        (conversations[number]["answer_id"], conversations[number]["row_id"], relevance, explanation, *share)
+        for (number, (relevance, explanation)), share in zip(sorted(results.items()), shares)
+    ]
+
+
+def run(
+    batch_size: int,
+    concurrency: int,
+    page_size: int,
+    relevances: Sequence[str],
+    limit: int = 0
+) -> Dict[str, int]:
+    """
+    Grades ungraded conversations page by page, oldest first, reading every conversation at most once.
+
+    Args:
+        batch_size (int): The number of answers per evaluator call.
+        concurrency (int): The maximum number of evaluator calls in flight.
+        page_size (int): The number of conversations read and written back at a time.
+        relevances (Sequence[str]): The relevance values that mark an answer as ungraded.
+        limit (int): Stop after this many conversations, zero for no limit. Defaults to 0.
+
+    Returns:
+        Dict[str, int]: The number of conversations 'read', 'graded' and 'updated'.
+    """
+    totals = {"read": 0, "graded": 0, "updated": 0}
+    after = None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while not limit or totals["read"] < limit:
+            size = min(page_size, limit - totals["read"]) if limit else page_size
+            conversations = get_ungraded_conversations(relevances, size, after)
+            if not conversations:
+                break
+            # Continue after this page, re-graded and failed conversations still match `relevances`
+            after = (conversations[-1]["timestamp"], conversations[-1]["id"])
+
+            batches = [conversations[i:i + batch_size] for i in range(0, len(conversations), batch_size)]
+            evaluations = [row for rows in executor.map(evaluate_batch, batches) for row in rows]
+            updated = update_relevances(evaluations, relevances)
+
+            totals["read"] += len(conversations)
+            totals["graded"] += len(evaluations)
+            totals["updated"] += updated
+            print(f"Graded {len(evaluations)} of {len(conversations)} answers, updated {updated}")
+
+    return totals
+
+
+def main() -> None:
+    """
+    Parses the command line and grades the ungraded conversations.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description="Grade the relevance of saved answers in batches.")
+    parser.add_argument("--batch-size", type=int, default=10, help="Answers per evaluator call")
+    parser.add_argument("--concurrency", type=int, default=4, help="Evaluator calls in flight")
+    parser.add_argument("--page-size", type=int, default=500, help="Conversations read and written back at a time")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many conversations")
+    parser.add_argument(
+        "--relevance", nargs="+", default=["PENDING"],
+        help="Relevance values to (re)grade, e.g. PENDING UNKNOWN",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    totals = run(args.batch_size, args.concurrency, args.page_size, args.relevance, args.limit)
+    print(
+        f"Read {totals['read']}, graded {totals['graded']} and updated {totals['updated']} conversations "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,30 @@ It includes functionalities for searching, generating prompts, evaluating answer
 
 Functions:
 - elastic_search_text: Searches for text matches in an Elasticsearch index.
+- elastic_search_rrf: Runs vector and text searches concurrently and fuses them with Reciprocal Rank Fusion.
+- local_search_knn: Performs a k-NN search on the in-process snapshot of the index.
+- local_search_text: Performs a BM25 text search on the in-process snapshot of the index.
+- local_search_hybrid: Performs a hybrid search on the in-process snapshot of the index.
+- local_search_rrf: Fuses k-NN and text searches on the in-process snapshot with Reciprocal Rank Fusion.
+- search_documents: Runs a search on the configured SEARCH_BACKEND, falling back to the snapshot if Elasticsearch fails.
+- text_search_query / knn_search_query / hybrid_search_query: Build the Elasticsearch search bodies.
+- build_evaluation_prompt / parse_evaluation: Build the relevance evaluation prompt and parse its reply.
+- build_rewrite_prompt: Builds the prompt used by `improve_query`.
+- build_answer_data: Collects the answer, evaluation, token usage and cost returned by `get_answer`.
+- grade_answer: Evaluates an answer inline or queues it for background evaluation.
+- get_index_version: Identifies the index version searches are answered from.
+- lookup_cached_answer / cache_answer / cache_when_graded: Reuse answers to semantically similar earlier queries.
+- is_well_formed: Decides whether a query can be used without an LLM rewrite.
+- rewrite_query: Rewrites a query with `improve_query` unless it is well formed or was rewritten before.
+- rewrite_and_search: Rewrites a query and retrieves its context, speculatively searching the raw query meanwhile.
 - build_prompt: Constructs a prompt for a language model based on a query and search results.
-- llm: Sends a prompt to a language model and retrieves the response, token usage, and response time.
+- llm: Sends a prompt to a language model and retrieves the response, token usage, and response time,
+  see llm_clients.py.
 - evaluate_relevance: Evaluates the relevance of a generated answer to a given question.
 - calculate_openai_cost: Calculates the cost of using OpenAI's API based on model choice and token usage.
 - get_answer: Retrieves an answer to a query by performing a search and evaluating the response.
+- embed_query: Embeds a query, reusing cached embeddings of previously seen queries.
+- get_cache_stats: Reports the hit rates of the in-process caches.
 
 Dependencies:
 - `elastic_search_knn`: Function for vector-based search in Elasticsearch.
@@ -27,43 +46,151 @@ Ensure that the necessary dependencies and API clients are correctly configured
 import os
 import time
 import json
+import uuid
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from openai import OpenAI
-from elasticsearch import Elasticsearch
+from elasticsearch import ApiError, Elasticsearch, TransportError
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional, Callable
+
+from ttl_cache import TTLCache
+from embedding_batcher import MicroBatchEncoder
+from local_index import LOCAL_INDEX_DIR, LocalVectorIndex
+from local_text_index import tokenize, top_k
+from semantic_cache import SemanticCache
+from relevance_worker import PENDING_EXPLANATION, PENDING_RELEVANCE, RelevanceWorker
+from database import update_relevance
+from llm_clients import llm
 
 
 load_dotenv()
 
 ELASTIC_URL = os.getenv("ELASTIC_URL", "http://elasticsearch:9200")
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434/v1/")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME")
 INDEX_NAME = os.getenv("INDEX_NAME")
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "2"))
+SEARCH_K = int(os.getenv("SEARCH_K", "5"))
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "10000"))
+RRF_RANK_CONSTANT = int(os.getenv("RRF_RANK_CONSTANT", "60"))
+RRF_WINDOW_SIZE = int(os.getenv("RRF_WINDOW_SIZE", "20"))
+RRF_NUM_CANDIDATES = int(os.getenv("RRF_NUM_CANDIDATES", "100"))
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", "8"))
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "elasticsearch")
+LOCAL_INDEX_RELOAD_INTERVAL = float(os.getenv("LOCAL_INDEX_RELOAD_INTERVAL", "30"))
+ES_SEARCH_TIMEOUT = float(os.getenv("ES_SEARCH_TIMEOUT", "10"))
+LOCAL_SEARCH_FALLBACK = os.getenv("LOCAL_SEARCH_FALLBACK", "true").lower() == "true"
+RELEVANCE_EVAL_MODE = os.getenv("RELEVANCE_EVAL_MODE", "inline")
+RELEVANCE_WORKERS = int(os.getenv("RELEVANCE_WORKERS", "2"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_CHECK_INTERVAL = float(os.getenv("SEMANTIC_CACHE_CHECK_INTERVAL", "30"))
+REWRITE_MODEL = os.getenv("REWRITE_MODEL", "openai/gpt-4o-mini")
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "10000"))
+REWRITE_CACHE_TTL = float(os.getenv("REWRITE_CACHE_TTL", "86400"))
+REWRITE_MAX_WORDS = int(os.getenv("REWRITE_MAX_WORDS", "40"))
+REWRITE_MAX_UNKNOWN_RATIO = float(os.getenv("REWRITE_MAX_UNKNOWN_RATIO", "0.1"))
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+SPECULATIVE_MIN_SIMILARITY = float(os.getenv("SPECULATIVE_MIN_SIMILARITY", "0.9"))
+SPECULATIVE_MIN_TOKEN_OVERLAP = float(os.getenv("SPECULATIVE_MIN_TOKEN_OVERLAP", "0.8"))
+
+
+# Searches give up after ES_SEARCH_TIMEOUT seconds, so a slow cluster can fall back to the local snapshot
+es_client = Elasticsearch(ELASTIC_URL, request_timeout=ES_SEARCH_TIMEOUT)
+
+# Runs the retrievers of a fused search concurrently
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="search")
+# Runs whole searches on the raw query while it is rewritten, separate from search_executor because
+# those searches submit to search_executor themselves
+speculation_executor = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="speculative-search")
+speculation_stats = {"reused": 0, "discarded": 0}
+_speculation_lock = threading.Lock()
+
+model = SentenceTransformer(MODEL_NAME)
+# Concurrent requests share batched model calls instead of serializing on single-string encodes
+embedding_batcher = MicroBatchEncoder(model, EMBED_MAX_BATCH_SIZE, EMBED_BATCH_WAIT_MS)
 
+query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+query_rewrite_cache = TTLCache(REWRITE_CACHE_SIZE, REWRITE_CACHE_TTL)
 
-es_client = Elasticsearch(ELASTIC_URL)
-ollama_client = OpenAI(base_url=OLLAMA_URL, api_key="ollama")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
-model = SentenceTransformer(MODEL_NAME)
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for cache lookups by lower-casing it and collapsing whitespace.
 
+    Args:
+        query (str): The query string.
 
-def elastic_search_text(query: str, index_name: str = INDEX_NAME) -> List[Dict[str, Any]]:
+    Returns:
+        str: The normalized query.
     """
-    Searches for text in the specified Elasticsearch index based on the query.
+    return " ".join(query.lower().split())
+
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    Embeds a query with the sentence transformer model, reusing the embedding of an identical
+    normalized query encoded earlier with the same model. Cache misses are encoded together with
+    concurrent requests by the micro-batching encoder.
+
+    Args:
+        query (str): The query string.
+
+    Returns:
+        np.ndarray: The query vector. It is shared with the cache and must not be modified.
+    """
+    normalized = normalize_query(query)
+    key = (MODEL_NAME, normalized)
+
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        # Encode the normalized text so a cached vector never depends on which variant was seen first
+        vector = embedding_batcher.encode(normalized)
+        vector.setflags(write=False)
+        query_embedding_cache.set(key, vector)
+    return vector
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Reports the usage of the in-process caches and of the micro-batching encoder behind them.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The statistics of every cache by name, see `TTLCache.stats` and
+        `SemanticCache.stats`, and the
+        'embedding_batches' and 'relevance_worker' statistics, see `MicroBatchEncoder.stats` and
+        `RelevanceWorker.stats`.
+    """
+    return {
+        "query_embedding": query_embedding_cache.stats(),
+        "embedding_batches": embedding_batcher.stats(),
+        "relevance_worker": relevance_worker.stats(),
+        "answer": answer_cache.stats(),
+        "query_rewrite": query_rewrite_cache.stats(),
+        "speculative_retrieval": dict(speculation_stats),
+    }
+
+
+def text_search_query(query: str, size: int = SEARCH_K) -> Dict[str, Any]:
+    """
+    Builds the body of a keyword search over the 'question' (boosted 3x) and 'answer' fields.
 
     Args:
         query (str): The search query string.
-        index_name (str): The name of the Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        size (int): The number of results to return. Defaults to SEARCH_K.
 
     Returns:
-        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
-    """   
-    search_query = {
-        "size": 5,
+        Dict[str, Any]: The Elasticsearch search body.
+    """
+    return {
+        "size": size,
+        "_source": ["question", "answer", "id"],
         "query": {
             "bool": {
                 "must": {
@@ -77,63 +204,101 @@ def elastic_search_text(query: str, index_name: str = INDEX_NAME) -> List[Dict[s
         },
     }
 
-    response = es_client.search(index=index_name, body=search_query)
+
+def elastic_search_text(query: str, index_name: str = INDEX_NAME, size: int = SEARCH_K) -> List[Dict[str, Any]]:
+    """
+    Searches for text in the specified Elasticsearch index based on the query.
+
+    Args:
+        query (str): The search query string.
+        index_name (str): The name of the Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        size (int): The number of results to return. Defaults to SEARCH_K.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+    """   
+    response = es_client.search(index=index_name, body=text_search_query(query, size))
     return [hit["_source"] for hit in response["hits"]["hits"]]
 
-def elastic_search_knn(field: str, vector: List[float], index_name: str = INDEX_NAME) -> List[Dict[str, Any]]:
+
+def knn_search_query(field: str, vector: List[float], k: int = SEARCH_K, num_candidates: int = KNN_NUM_CANDIDATES) -> Dict[str, Any]:
     """
-    Perform a k-nearest neighbor (k-NN) search in the specified Elasticsearch index based on a query vector.
+    Builds the body of a k-nearest neighbor (k-NN) search.
 
     Args:
         field (str): The field name in the index where the vector is stored.
         vector (List[float]): The query vector for which to find the nearest neighbors.
-        index_name (str): The name of the Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        k (int): The number of nearest neighbors to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of candidates considered per shard. Defaults to KNN_NUM_CANDIDATES.
 
     Returns:
-        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+        Dict[str, Any]: The Elasticsearch search body.
     """
     knn_query = {
         "field": field,
         "query_vector": vector,
-        "k": 5,  # Number of nearest neighbors to retrieve
-        "num_candidates": 10000  # Number of candidates to consider for finding the nearest neighbors
+        "k": k,  # Number of nearest neighbors to retrieve
+        "num_candidates": max(num_candidates, k)  # Number of candidates to consider, may not be less than k
     }
 
-    search_query = {
+    return {
         "knn": knn_query,  # Move knn to top-level of the body
         "_source": ["question", "answer", "id"],
-        "size": 5  # Number of results to return
+        "size": k  # Number of results to return
     }
 
-    es_results = es_client.search(index=index_name, body=search_query)
+
+def elastic_search_knn(
+    field: str, 
+    vector: List[float], 
+    index_name: str = INDEX_NAME,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a k-nearest neighbor (k-NN) search in the specified Elasticsearch index based on a query vector.
+
+    Args:
+        field (str): The field name in the index where the vector is stored.
+        vector (List[float]): The query vector for which to find the nearest neighbors.
+        index_name (str): The name of the Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        k (int): The number of nearest neighbors to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of candidates considered per shard. Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+    """
+    es_results = es_client.search(index=index_name, body=knn_search_query(field, vector, k, num_candidates))
 
     return [hit["_source"] for hit in es_results["hits"]["hits"]]
 
 
-def elastic_search_hybrid(
+def hybrid_search_query(
     field: str, 
     query: str, 
     vector: List[float], 
-    index_name: str = INDEX_NAME
-) -> List[Dict[str, Any]]:
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> Dict[str, Any]:
     """
-    Perform a hybrid search on Elasticsearch combining k-NN vector search and keyword matching.
+    Builds the body of a hybrid search combining k-NN vector search and keyword matching, each weighted 0.5.
 
     Args:
         field (str): The field to use for the k-NN search.
         query (str): The keyword query string.
         vector (List[float]): The query vector for k-NN search.
-        index_name (str): The Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        k (int): The number of nearest neighbors and of results to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered per shard. Defaults to KNN_NUM_CANDIDATES.
 
     Returns:
-        List[Dict[str, Any]]: A list of search result documents from Elasticsearch.
+        Dict[str, Any]: The Elasticsearch search body.
     """
     # k-NN query
     knn_query = {
         "field": field,
         "query_vector": vector,
-        "k": 5,
-        "num_candidates": 10000,
+        "k": k,
+        "num_candidates": max(num_candidates, k),
         "boost": 0.5
     }
 
@@ -152,18 +317,353 @@ def elastic_search_hybrid(
     }
 
     # Hybrid search combining k-NN and keyword search
-    search_query = {
+    return {
         "knn": knn_query,
         "query": keyword_query,
-        "size": 5,
+        "size": k,
         "_source": ["question", "answer","id"]
     }
 
+
+def elastic_search_hybrid(
+    field: str, 
+    query: str, 
+    vector: List[float], 
+    index_name: str = INDEX_NAME,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a hybrid search on Elasticsearch combining k-NN vector search and keyword matching.
+
+    Args:
+        field (str): The field to use for the k-NN search.
+        query (str): The keyword query string.
+        vector (List[float]): The query vector for k-NN search.
+        index_name (str): The Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        k (int): The number of nearest neighbors and of results to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered per shard. Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents from Elasticsearch.
+    """
+    search_query = hybrid_search_query(field, query, vector, k, num_candidates)
     es_results = es_client.search(index=index_name, body=search_query)
 
     return [hit["_source"] for hit in es_results["hits"]["hits"]]
 
 
+_local_index: Optional[LocalVectorIndex] = None
+_local_index_checked_at = 0.0
+_local_index_lock = threading.Lock()
+
+
+def get_local_index() -> LocalVectorIndex:
+    """
+    Returns the in-process snapshot of the index, loading it on first use.
+
+    Every LOCAL_INDEX_RELOAD_INTERVAL seconds the snapshot directory is checked, and a snapshot
+    exported by a later ingestion run replaces the loaded one. If the new snapshot cannot be read,
+    the loaded one keeps being served.
+
+    Returns:
+        LocalVectorIndex: The loaded snapshot.
+    """
+    global _local_index, _local_index_checked_at
+
+    with _local_index_lock:
+        now = time.monotonic()
+        if _local_index is None or now - _local_index_checked_at > LOCAL_INDEX_RELOAD_INTERVAL:
+            _local_index_checked_at = now
+            try:
+                with open(os.path.join(LOCAL_INDEX_DIR, "meta.json")) as f:
+                    created_at = json.load(f)["created_at"]
+                if _local_index is None or _local_index.meta["created_at"] != created_at:
+                    _local_index = LocalVectorIndex(LOCAL_INDEX_DIR)
+            except (OSError, ValueError) as e:
+                if _local_index is None:
+                    raise
+                print(f"Could not reload the local index, keeping the loaded snapshot: {e!r}")
+        return _local_index
+
+
+def local_search_knn(
+    field: str, 
+    vector: List[float], 
+    index_name: str = INDEX_NAME,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a k-nearest neighbor (k-NN) search on the in-process snapshot of the index, with the same
+    contract as `elastic_search_knn`.
+
+    Args:
+        field (str): The field name in the index where the vector is stored.
+        vector (List[float]): The query vector for which to find the nearest neighbors.
+        index_name (str): Unused, the snapshot is always exported from INDEX_NAME.
+        k (int): The number of nearest neighbors to return. Defaults to SEARCH_K.
+        num_candidates (int): The HNSW search breadth if the snapshot has HNSW graphs. Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+    """
+    return get_local_index().search(field, vector, k, ef=num_candidates)
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]], 
+    size: int = 5, 
+    rank_constant: int = RRF_RANK_CONSTANT
+) -> List[Dict[str, Any]]:
+    """
+    Fuses several ranked result lists with Reciprocal Rank Fusion.
+
+    Every document scores the sum of 1 / (rank_constant + rank) over the lists it appears in, so only
+    the ranks matter and scores of different retrievers never have to be comparable.
+
+    Args:
+        result_lists (List[List[Dict[str, Any]]]): Ranked search results, each document containing an 'id'.
+        size (int): The number of fused results to return. Defaults to 5.
+        rank_constant (int): Dampens the influence of the top ranks. Defaults to RRF_RANK_CONSTANT.
+
+    Returns:
+        List[Dict[str, Any]]: The best `size` documents by fused score.
+    """
+    scores: Dict[Any, float] = {}
+    documents: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            scores[doc["id"]] = scores.get(doc["id"], 0.0) + 1.0 / (rank_constant + rank)
+            documents.setdefault(doc["id"], doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:size]
+    return [documents[doc_id] for doc_id in ranked]
+
+
+def elastic_search_rrf(
+    field: str, 
+    query: str, 
+    vector: List[float], 
+    index_name: str = INDEX_NAME,
+    size: int = SEARCH_K,
+    rank_constant: int = RRF_RANK_CONSTANT,
+    window_size: int = RRF_WINDOW_SIZE,
+    num_candidates: int = RRF_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a hybrid search that fuses separate k-NN and keyword searches with Reciprocal Rank Fusion.
+
+    Both searches run concurrently, each returning its top `window_size` documents, and the two rankings
+    are fused client-side, see `reciprocal_rank_fusion`.
+
+    Args:
+        field (str): The field to use for the k-NN search.
+        query (str): The keyword query string.
+        vector (List[float]): The query vector for k-NN search.
+        index_name (str): The Elasticsearch index to search. Defaults to the global INDEX_NAME.
+        size (int): The number of fused results to return. Defaults to SEARCH_K.
+        rank_constant (int): The RRF rank constant. Defaults to RRF_RANK_CONSTANT.
+        window_size (int): The number of results taken from each search. Defaults to RRF_WINDOW_SIZE.
+        num_candidates (int): The number of k-NN candidates considered per shard. Defaults to RRF_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents from Elasticsearch.
+    """
+    knn_future = search_executor.submit(
+        elastic_search_knn, field, vector, index_name, window_size, max(num_candidates, window_size)
+    )
+    text_future = search_executor.submit(elastic_search_text, query, index_name, window_size)
+
+    return reciprocal_rank_fusion([knn_future.result(), text_future.result()], size, rank_constant)
+
+
+def local_search_text(query: str, index_name: str = INDEX_NAME, size: int = SEARCH_K) -> List[Dict[str, Any]]:
+    """
+    Searches for text in the in-process snapshot of the index with BM25, with the same contract as
+    `elastic_search_text`.
+
+    Args:
+        query (str): The search query string.
+        index_name (str): Unused, the snapshot is always exported from INDEX_NAME.
+        size (int): The number of results to return. Defaults to SEARCH_K.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search results, where each result is a dictionary containing the source data.
+    """
+    local_index = get_local_index()
+    rows, _ = local_index.text_index.search_rows(query, size)
+    return [local_index.document(row) for row in rows]
+
+
+def local_search_hybrid(
+    field: str, 
+    query: str, 
+    vector: List[float], 
+    index_name: str = INDEX_NAME,
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform a hybrid search on the in-process snapshot of the index, with the same contract and scoring as
+    `elastic_search_hybrid`: the k nearest neighbours score half their cosine score, every keyword match
+    half its BM25 score, and documents found by both add the two.
+
+    Args:
+        field (str): The field to use for the k-NN search.
+        query (str): The keyword query string.
+        vector (List[float]): The query vector for k-NN search.
+        index_name (str): Unused, the snapshot is always exported from INDEX_NAME.
+        k (int): The number of nearest neighbors and of results to return. Defaults to SEARCH_K.
+        num_candidates (int): The HNSW search breadth if the snapshot has HNSW graphs. Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents.
+    """
+    local_index = get_local_index()
+    knn_rows, knn_scores = local_index.search_rows(field, vector, k, ef=num_candidates)
+
+    scores = 0.5 * local_index.text_index.score(query)
+    scores[knn_rows] += 0.5 * knn_scores
+
+    rows, _ = top_k(scores, k)
+    return [local_index.document(row) for row in rows]
+
+
+def local_search_rrf(
+    field: str, 
+    query: str, 
+    vector: List[float], 
+    index_name: str = INDEX_NAME,
+    size: int = SEARCH_K,
+    rank_constant: int = RRF_RANK_CONSTANT,
+    window_size: int = RRF_WINDOW_SIZE,
+    num_candidates: int = RRF_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Perform the rank-fused hybrid search of `elastic_search_rrf` on the in-process snapshot of the index.
+
+    Args:
+        field (str): The field to use for the k-NN search.
+        query (str): The keyword query string.
+        vector (List[float]): The query vector for k-NN search.
+        index_name (str): Unused, the snapshot is always exported from INDEX_NAME.
+        size (int): The number of fused results to return. Defaults to SEARCH_K.
+        rank_constant (int): The RRF rank constant. Defaults to RRF_RANK_CONSTANT.
+        window_size (int): The number of results taken from each search. Defaults to RRF_WINDOW_SIZE.
+        num_candidates (int): The HNSW search breadth if the snapshot has HNSW graphs. Defaults to RRF_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents.
+    """
+    knn_results = local_search_knn(field, vector, k=window_size, num_candidates=max(num_candidates, window_size))
+    text_results = local_search_text(query, size=window_size)
+    return reciprocal_rank_fusion([knn_results, text_results], size, rank_constant)
+
+
+def run_search(
+    search_type: str, 
+    query: str, 
+    k: int, 
+    num_candidates: int, 
+    local: bool
+) -> List[Dict[str, Any]]:
+    """
+    Runs a search of the given type on Elasticsearch or on the local snapshot, without fallback.
+
+    Args:
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        query (str): The query string.
+        k (int): The number of documents to return.
+        num_candidates (int): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+        local (bool): Whether to search the local snapshot instead of Elasticsearch.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents.
+    """
+    if search_type == 'Vector':
+        search_knn = local_search_knn if local else elastic_search_knn
+        return search_knn('question_vector', embed_query(query), k=k, num_candidates=num_candidates)
+    if search_type == 'Hybrid':
+        search_hybrid = local_search_hybrid if local else elastic_search_hybrid
+        return search_hybrid('question_vector', query, embed_query(query), k=k, num_candidates=num_candidates)
+    if search_type == 'RRF':
+        search_rrf = local_search_rrf if local else elastic_search_rrf
+        # Each ranking needs at least k documents for the fused one to fill k
+        return search_rrf(
+            'question_vector', query, embed_query(query), size=k, num_candidates=num_candidates,
+            window_size=max(RRF_WINDOW_SIZE, k)
+        )
+    search_text = local_search_text if local else elastic_search_text
+    return search_text(query, size=k)
+
+
+def resolve_search_settings(search_type: str, k: Optional[int], num_candidates: Optional[int]) -> Tuple[int, int]:
+    """
+    Fills in the defaults of the per-request search settings.
+
+    Args:
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        k (Optional[int]): The number of documents to retrieve, or None for SEARCH_K.
+        num_candidates (Optional[int]): The number of k-NN candidates, or None for RRF_NUM_CANDIDATES with
+            RRF search and KNN_NUM_CANDIDATES otherwise.
+
+    Returns:
+        Tuple[int, int]: The number of documents and of k-NN candidates.
+    """
+    default_candidates = RRF_NUM_CANDIDATES if search_type == 'RRF' else KNN_NUM_CANDIDATES
+    return k or SEARCH_K, num_candidates or default_candidates
+
+
+def can_fall_back(error: Exception) -> bool:
+    """
+    Decides whether a failed Elasticsearch search may be answered from the local snapshot instead.
+
+    Args:
+        error (Exception): The error raised by the Elasticsearch client.
+
+    Returns:
+        bool: True for connection errors, timeouts and server side errors, if LOCAL_SEARCH_FALLBACK is
+        enabled and a snapshot was exported.
+    """
+    if isinstance(error, ApiError) and error.meta.status < 500:
+        return False  # A rejected query fails the same way everywhere
+    return LOCAL_SEARCH_FALLBACK and os.path.exists(os.path.join(LOCAL_INDEX_DIR, "meta.json"))
+
+
+def search_documents(
+    search_type: str, 
+    query: str, 
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES
+) -> List[Dict[str, Any]]:
+    """
+    Retrieves the context documents for a query on the configured SEARCH_BACKEND, 'elasticsearch' or 'local'.
+
+    When Elasticsearch is unreachable, times out after ES_SEARCH_TIMEOUT seconds or fails on the server side,
+    the search is answered from the in-process snapshot instead, if LOCAL_SEARCH_FALLBACK is enabled and a
+    snapshot was exported.
+
+    Args:
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        query (str): The query string.
+        k (int): The number of documents to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to KNN_NUM_CANDIDATES.
+
+    Returns:
+        List[Dict[str, Any]]: A list of search result documents.
+    """
+    if SEARCH_BACKEND == "local":
+        return run_search(search_type, query, k, num_candidates, local=True)
+
+    try:
+        return run_search(search_type, query, k, num_candidates, local=False)
+    except (TransportError, ApiError) as e:
+        if not can_fall_back(e):
+            raise
+        print(f"Elasticsearch search failed ({e!r}), answering from the local snapshot")
+        return run_search(search_type, query, k, num_candidates, local=True)
 
 
 def build_prompt(query: str, search_results: List[Dict[str, str]]) -> str:
@@ -199,79 +699,17 @@ def build_prompt(query: str, search_results: List[Dict[str, str]]) -> str:
     )
     return prompt_template.format(question=query, context=context).strip()
 
-def llm(prompt: str, model_choice: str) -> Tuple[str, Dict[str, int], float]:
-    """
-    Sends a prompt to a specified language model and retrieves the response, token usage, and response time.
-
-    Supports models from 'ollama/' and 'openai/' prefixes. Raises a ValueError for unknown model choices.
 
-    Args:
-        prompt (str): The input prompt to send to the language model.
-        model_choice (str): The identifier for the model to use. Should start with 'ollama/' or 'openai/'.
-
-    Returns:
-        Tuple[str, Dict[str, int], float]: A tuple containing:
-            - The response content from the model (str).
-            - A dictionary with token usage metrics:
-                - 'prompt_tokens' (int): Number of tokens in the prompt.
-                - 'completion_tokens' (int): Number of tokens in the completion.
-                - 'total_tokens' (int): Total number of tokens used.
-            - The response time in seconds (float).
+def build_evaluation_prompt(question: str, answer: str) -> str:
     """
-    start_time = time.time()
-    
-    if model_choice.startswith('ollama/'):
-        response = ollama_client.chat.completions.create(
-            model=model_choice.split('/')[-1],
-            messages=[{"role": "user", "content": prompt}]
-        )
-    elif model_choice.startswith('openai/'):
-        response = openai_client.chat.completions.create(
-            model=model_choice.split('/')[-1],
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-    elif model_choice.startswith('aws_bedrock/'):
-        response = openai_client.chat.completions.create(
-            model=model_choice.split('/')[-1],
-            messages=[{"role": "user", "content": prompt}]
-        )
-    else:
-        raise ValueError(f"Unknown model choice: {model_choice}")
-    
-    answer = response.choices[0].message.content
-    tokens = {
-        'prompt_tokens': response.usage.prompt_tokens,
-        'completion_tokens': response.usage.completion_tokens,
-        'total_tokens': response.usage.total_tokens
-    }
-    
-    end_time = time.time()
-    response_time = end_time - start_time
-    
-    return answer, tokens, response_time
-
-
-def evaluate_relevance(question: str, answer: str) -> Tuple[str, str, Dict[str, int]]:
-    """
-    Evaluates the relevance of a generated answer to a given question using a language model.
-
-    The function constructs a prompt for an evaluator model to classify the relevance of the answer as
-    "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT". It returns the relevance classification, 
-    an explanation, and token usage metrics.
+    Builds the prompt asking the evaluator model to grade the relevance of an answer to a question.
 
     Args:
         question (str): The question to which the answer was generated.
         answer (str): The generated answer to evaluate.
 
     Returns:
-        Tuple[str, str, Dict[str, int]]:
-            - Relevance classification ("NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT").
-            - A brief explanation for the evaluation.
-            - A dictionary with token usage metrics:
-                - 'prompt_tokens' (int): Number of tokens in the prompt.
-                - 'completion_tokens' (int): Number of tokens in the completion.
-                - 'total_tokens' (int): Total number of tokens used.
+        str: The evaluation prompt.
     """
     prompt_template = """
     You are an expert evaluator for a Retrieval-Augmented Generation (RAG) system.
@@ -293,14 +731,53 @@ def evaluate_relevance(question: str, answer: str) -> Tuple[str, str, Dict[str,
     }}
     """.strip()
 
-    prompt = prompt_template.format(question=question, answer=answer)
-    evaluation, tokens, _ = llm(prompt, 'openai/gpt-4o-mini')
-    
+    return prompt_template.format(question=question, answer=answer)
+
+
+def parse_evaluation(evaluation: str) -> Tuple[str, str]:
+    """
+    Parses the JSON reply of the evaluator model.
+
+    Args:
+        evaluation (str): The reply of the evaluator model.
+
+    Returns:
+        Tuple[str, str]: The relevance classification and its explanation, or "UNKNOWN" if the reply
+        could not be parsed.
+    """
     try:
         json_eval = json.loads(evaluation)
-        return json_eval['Relevance'], json_eval['Explanation'], tokens
+        return json_eval['Relevance'], json_eval['Explanation']
     except json.JSONDecodeError:
-        return "UNKNOWN", "Failed to parse evaluation", tokens
+        return "UNKNOWN", "Failed to parse evaluation"
+
+
+def evaluate_relevance(question: str, answer: str) -> Tuple[str, str, Dict[str, int]]:
+    """
+    Evaluates the relevance of a generated answer to a given question using a language model.
+
+    The function constructs a prompt for an evaluator model to classify the relevance of the answer as
+    "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT". It returns the relevance classification, 
+    an explanation, and token usage metrics.
+
+    Args:
+        question (str): The question to which the answer was generated.
+        answer (str): The generated answer to evaluate.
+
+    Returns:
+        Tuple[str, str, Dict[str, int]]:
+            - Relevance classification ("NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT").
+            - A brief explanation for the evaluation.
+            - A dictionary with token usage metrics:
+                - 'prompt_tokens' (int): Number of tokens in the prompt.
+                - 'completion_tokens' (int): Number of tokens in the completion.
+                - 'total_tokens' (int): Total number of tokens used.
+    """
+    prompt = build_evaluation_prompt(question, answer)
+    evaluation, tokens, _ = llm(prompt, 'openai/gpt-4o-mini')
+    
+    relevance, explanation = parse_evaluation(evaluation)
+    return relevance, explanation, tokens
 
 
 def calculate_openai_cost(model_choice: str, tokens: Dict[str, int]) -> float:
@@ -330,21 +807,17 @@ def calculate_openai_cost(model_choice: str, tokens: Dict[str, int]) -> float:
 
     return openai_cost
 
-def improve_query(user_query: str, model: str = 'openai/gpt-4o-mini') -> str:
+def build_rewrite_prompt(user_query: str) -> str:
     """
-    Enhances a user's query by correcting spelling, fixing grammar, and improving clarity, while maintaining the original 
-    context and similar length. Can use either OpenAI API or an Ollama server.
+    Builds the prompt asking a model to rewrite a user's query for clarity, spelling and grammar.
 
     Args:
         user_query (str): The original query from the user.
-        model (str): The name of the LLM model to use for processing the query (default is 'text-davinci-003' for OpenAI).
-        service (str): The service to use, either 'openai' or 'ollama' (default is 'openai').
 
     Returns:
-        str: The improved query with better spelling, grammar, and clarity.
+        str: The rewrite prompt.
     """
-
-    prompt = f"""
+    return f"""
     The following is a user's query: "{user_query}"
 
     Please rewrite the query to improve clarity, fix any spelling or grammar mistakes, and maintain the same context.
@@ -352,28 +825,399 @@ def improve_query(user_query: str, model: str = 'openai/gpt-4o-mini') -> str:
 
     Rewritten query:
     """
+
+
+def improve_query(user_query: str, model: str = 'openai/gpt-4o-mini') -> str:
+    """
+    Enhances a user's query by correcting spelling, fixing grammar, and improving clarity, while maintaining the original 
+    context and similar length. Can use either OpenAI API or an Ollama server.
+
+    Args:
+        user_query (str): The original query from the user.
+        model (str): The name of the LLM model to use for processing the query (default is 'text-davinci-003' for OpenAI).
+        service (str): The service to use, either 'openai' or 'ollama' (default is 'openai').
+
+    Returns:
+        str: The improved query with better spelling, grammar, and clarity.
+    """
+
+    prompt = build_rewrite_prompt(user_query)
     improved_query, _, _ = llm(prompt, model)
     
     return improved_query
 
 
 
+def is_well_formed(query: str) -> bool:
+    """
+    Cheaply decides whether a query can be searched as it is, without an LLM rewrite.
+
+    A query is well formed if it has at most REWRITE_MAX_WORDS words and at most REWRITE_MAX_UNKNOWN_RATIO of
+    its words are missing from the vocabulary of the indexed questions and answers, which catches most
+    misspellings. The vocabulary comes from the local snapshot; without one every query is rewritten.
+
+    Args:
+        query (str): The query string.
+
+    Returns:
+        bool: Whether the query can skip the rewrite.
+    """
+    words = [word for word in tokenize(query) if not word.isdigit()]
+    if not words or len(words) > REWRITE_MAX_WORDS:
+        return False
+
+    try:
+        vocabulary = get_local_index().text_index.term_ids
+    except OSError:  # No snapshot was exported
+        return False
+
+    unknown = sum(word not in vocabulary for word in words)
+    return unknown / len(words) <= REWRITE_MAX_UNKNOWN_RATIO
+
+
+def plan_rewrite(query: str, rewrite: Optional[bool] = None) -> Tuple[Optional[str], Tuple[str, str]]:
+    """
+    Resolves a query rewrite without calling the LLM where possible.
+
+    Args:
+        query (str): The query string.
+        rewrite (Optional[bool]): False to never rewrite, True to rewrite even well formed queries.
+            Defaults to None, rewriting queries that are not well formed, see `is_well_formed`.
+
+    Returns:
+        Tuple[Optional[str], Tuple[str, str]]: The query to search with, or None if the LLM has to rewrite
+        it, and the cache key to store that rewrite under.
+    """
+    key = (REWRITE_MODEL, normalize_query(query))
+    if rewrite is False or (rewrite is None and is_well_formed(query)):
+        return query, key
+    return query_rewrite_cache.get(key), key
+
+
+def rewrite_query(query: str, rewrite: Optional[bool] = None) -> str:
+    """
+    Rewrites a query with `improve_query`, unless it is well formed or the same normalized query was
+    rewritten before.
+
+    Args:
+        query (str): The query string.
+        rewrite (Optional[bool]): False to never rewrite, True to rewrite even well formed queries.
+            Defaults to None, see `plan_rewrite`.
+
+    Returns:
+        str: The query to search with.
+    """
+    rewritten, key = plan_rewrite(query, rewrite)
+    if rewritten is None:
+        rewritten = improve_query(query, REWRITE_MODEL)
+        query_rewrite_cache.set(key, rewritten)
+    return rewritten
+
+
+def speculation_holds(
+    query: str,
+    rewritten: str,
+    query_vector: Optional[np.ndarray] = None,
+    rewritten_vector: Optional[np.ndarray] = None
+) -> bool:
+    """
+    Decides whether results retrieved for the raw query can stand in for those of its rewrite.
+
+    Comparing the actual results would need the second search the speculation is meant to save, so the
+    queries are compared instead. Searches using embeddings compare the embeddings of the two queries,
+    Text search, which only matches terms, compares their terms.
+
+    Args:
+        query (str): The raw query.
+        rewritten (str): The rewritten query.
+        query_vector (Optional[np.ndarray]): The embedding of the raw query, None for Text search.
+        rewritten_vector (Optional[np.ndarray]): The embedding of the rewritten query, None for Text search.
+
+    Returns:
+        bool: Whether the queries are equal after normalisation, or their cosine similarity reaches
+        SPECULATIVE_MIN_SIMILARITY, or without embeddings the overlap (Jaccard index) of their terms
+        reaches SPECULATIVE_MIN_TOKEN_OVERLAP.
+    """
+    if normalize_query(rewritten) == normalize_query(query):
+        holds = True
+    elif query_vector is None or rewritten_vector is None:
+        terms, rewritten_terms = set(tokenize(query)), set(tokenize(rewritten))
+        union = terms | rewritten_terms
+        holds = bool(union) and len(terms & rewritten_terms) / len(union) >= SPECULATIVE_MIN_TOKEN_OVERLAP
+    else:
+        norms = np.linalg.norm(query_vector) * np.linalg.norm(rewritten_vector)
+        similarity = float(np.dot(query_vector, rewritten_vector) / norms) if norms else 0.0
+        holds = similarity >= SPECULATIVE_MIN_SIMILARITY
+
+    with _speculation_lock:
+        speculation_stats["reused" if holds else "discarded"] += 1
+    return holds
+
+
+def rewrite_and_search(
+    query: str, 
+    search_type: str, 
+    k: int = SEARCH_K,
+    num_candidates: int = KNN_NUM_CANDIDATES,
+    rewrite: Optional[bool] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Rewrites a query, see `rewrite_query`, and retrieves the context documents for the rewritten query.
+
+    With SPECULATIVE_RETRIEVAL enabled, a query that needs an LLM rewrite is searched as typed while the
+    rewrite is in flight. If the rewrite stays close to the raw query, see `speculation_holds`, those results
+    are used, otherwise the rewritten query is searched once it arrives.
+
+    Args:
+        query (str): The raw query string.
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        k (int): The number of documents to return. Defaults to SEARCH_K.
+        num_candidates (int): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to KNN_NUM_CANDIDATES.
+        rewrite (Optional[bool]): Whether to rewrite the query, see `plan_rewrite`. Defaults to None.
+
+    Returns:
+        Tuple[str, List[Dict[str, Any]]]: The rewritten query and the search result documents.
+    """
+    rewritten, key = plan_rewrite(query, rewrite)
+    speculative = None
+    if rewritten is None:
+        if SPECULATIVE_RETRIEVAL:
+            speculative = speculation_executor.submit(search_documents, search_type, query, k, num_candidates)
+        rewritten = improve_query(query, REWRITE_MODEL)
+        query_rewrite_cache.set(key, rewritten)
+
+    if speculative is not None:
+        # Text search never needs the embeddings, compare the terms of the queries instead
+        vectors = () if search_type == 'Text' else (embed_query(query), embed_query(rewritten))
+        if speculation_holds(query, rewritten, *vectors):
+            return rewritten, speculative.result()
+    return rewritten, search_documents(search_type, rewritten, k=k, num_candidates=num_candidates)
+
+
+def build_answer_data(
+    answer: str,
+    response_time: float,
+    relevance: str,
+    explanation: str,
+    model_choice: str,
+    tokens: Dict[str, int],
+    eval_tokens: Dict[str, int],
+    answer_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Collects the generated answer, its evaluation, token usage and cost into the answer data returned to
+    the frontend and stored by `save_conversation`.
+
+    Args:
+        answer (str): The generated answer.
+        response_time (float): The time taken to generate the answer.
+        relevance (str): The relevance classification of the answer.
+        explanation (str): Explanation for the relevance classification.
+        model_choice (str): The model used to generate the answer.
+        tokens (Dict[str, int]): The token usage of the answer.
+        eval_tokens (Dict[str, int]): The token usage of the evaluation.
+        answer_id (Optional[str]): The id of the answer. Defaults to a new random id.
+
+    Returns:
+        Dict[str, Any]: The answer data, see `get_answer`.
+    """
+    # Calculate cost
+    openai_cost = calculate_openai_cost(model_choice, tokens)
+ 
+    return {
+        'answer': answer,
+        'response_time': response_time,
+        'relevance': relevance,
+        'relevance_explanation': explanation,
+        'model_used': model_choice,
+        'prompt_tokens': tokens['prompt_tokens'],
+        'completion_tokens': tokens['completion_tokens'],
+        'total_tokens': tokens['total_tokens'],
+        'eval_prompt_tokens': eval_tokens['prompt_tokens'],
+        'eval_completion_tokens': eval_tokens['completion_tokens'],
+        'eval_total_tokens': eval_tokens['total_tokens'],
+        'openai_cost': openai_cost,
+        'answer_id': answer_id or uuid.uuid4().hex
+    }
+
+
+# Grades answers in the background when their evaluation is deferred
+relevance_worker = RelevanceWorker(evaluate_relevance, update_relevance, RELEVANCE_WORKERS)
+
+
+def grade_answer(
+    answer_id: str, 
+    question: str, 
+    answer: str, 
+    defer_evaluation: Optional[bool] = None,
+    on_evaluated: Optional[Callable[[str, str, Dict[str, int]], None]] = None
+) -> Tuple[str, str, Dict[str, int]]:
+    """
+    Evaluates the relevance of an answer, or queues it for evaluation by the background worker.
+
+    Deferred answers are graded "PENDING" with no evaluation tokens, and the worker backfills the
+    saved conversation with the given answer id once the evaluation finishes.
+
+    Args:
+        answer_id (str): The id the answer is returned and saved with.
+        question (str): The question to which the answer was generated.
+        answer (str): The generated answer to evaluate.
+        defer_evaluation (Optional[bool]): Whether to evaluate in the background. Defaults to
+            RELEVANCE_EVAL_MODE being 'deferred'.
+        on_evaluated (Optional[Callable[[str, str, Dict[str, int]], None]]): Called with the result of a
+            deferred evaluation once the worker finished it, see `cache_when_graded`. Defaults to None.
+
+    Returns:
+        Tuple[str, str, Dict[str, int]]: The relevance classification, explanation and token usage,
+        see `evaluate_relevance`.
+    """
+    if defer_evaluation is None:
+        defer_evaluation = RELEVANCE_EVAL_MODE == "deferred"
+
+    if defer_evaluation:
+        relevance_worker.submit(answer_id, question, answer, on_evaluated)
+        return PENDING_RELEVANCE, PENDING_EXPLANATION, {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    return evaluate_relevance(question, answer)
+
+
+def get_index_version() -> Any:
+    """
+    Identifies the data searches are currently answered from, so cached answers can be dropped when the
+    index is rebuilt or synced.
+
+    Returns:
+        Any: The concrete indices INDEX_NAME points to with the time of their last incremental sync, or the
+        version of the local snapshot with the 'local' SEARCH_BACKEND.
+    """
+    if SEARCH_BACKEND == "local":
+        return get_local_index().version
+    indices = es_client.indices.get(index=INDEX_NAME).body
+    return tuple(sorted(
+        (name, index["mappings"].get("_meta", {}).get("synced_at")) for name, index in indices.items()
+    ))
+
+
+# Answers to earlier queries, matched by the similarity of the raw query embeddings
+answer_cache = SemanticCache(
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD, get_index_version, SEMANTIC_CACHE_CHECK_INTERVAL
+)
+
+
+def lookup_cached_answer(query_vector: np.ndarray, scope: Tuple, start_time: float) -> Optional[Dict[str, Any]]:
+    """
+    Looks up the answer to a semantically similar earlier query.
+
+    A cached answer costs no tokens, so its token counts and cost are reported as zero, and it gets a new
+    answer id so it is saved as an answer of its own.
+
+    Args:
+        query_vector (np.ndarray): The embedding of the raw query.
+        scope (Tuple): The model choice, search type and search settings the answer must have been generated with.
+        start_time (float): When the request started, for the response time.
+
+    Returns:
+        Optional[Dict[str, Any]]: The answer data, see `get_answer`, or None if no similar query was answered.
+    """
+    cached = answer_cache.get(scope, query_vector)
+    if cached is None:
+        return None
+
+    no_tokens = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    return {
+        **cached,
+        **{key: 0 for key in no_tokens},
+        **{f'eval_{key}': 0 for key in no_tokens},
+        'openai_cost': 0.0,
+        'response_time': time.time() - start_time,
+        'answer_id': uuid.uuid4().hex,
+    }
+
+
+def cache_answer(query_vector: np.ndarray, scope: Tuple, answer_data: Dict[str, Any]) -> None:
+    """
+    Caches an answer for semantically similar later queries. Answers graded as not relevant are not cached,
+    and neither are answers still waiting for their evaluation, see `cache_when_graded`.
+
+    Args:
+        query_vector (np.ndarray): The embedding of the raw query.
+        scope (Tuple): The model choice, search type and search settings the answer was generated with.
+        answer_data (Dict[str, Any]): The answer data, see `get_answer`.
+    """
+    if answer_data['relevance'] not in ('NON_RELEVANT', PENDING_RELEVANCE):
+        answer_cache.set(scope, query_vector, dict(answer_data))
+
+
+def cache_when_graded(
+    query_vector: Optional[np.ndarray],
+    scope: Tuple,
+    answer: str,
+    response_time: float,
+    model_choice: str,
+    tokens: Dict[str, int],
+    answer_id: str
+) -> Optional[Callable[[str, str, Dict[str, int]], None]]:
+    """
+    Builds the callback that caches an answer whose evaluation was deferred once the worker graded it.
+
+    Args:
+        query_vector (Optional[np.ndarray]): The embedding of the raw query, None if the cache is disabled.
+        scope (Tuple): The model choice, search type and search settings the answer was generated with.
+        answer (str): The generated answer.
+        response_time (float): The time taken to generate the answer.
+        model_choice (str): The model used to generate the answer.
+        tokens (Dict[str, int]): The token usage of the answer.
+        answer_id (str): The id of the answer.
+
+    Returns:
+        Optional[Callable[[str, str, Dict[str, int]], None]]: The `on_evaluated` callback of `grade_answer`,
+        or None if the cache is disabled.
+    """
+    if query_vector is None:
+        return None
+    version = answer_cache.version
+
+    def on_evaluated(relevance: str, explanation: str, eval_tokens: Dict[str, int]) -> None:
+        if answer_cache.version != version:
+            return  # The index changed while the answer was graded, it may no longer hold
+        answer_data = build_answer_data(
+            answer, response_time, relevance, explanation, model_choice, tokens, eval_tokens, answer_id
+        )
+        cache_answer(query_vector, scope, answer_data)
+
+    return on_evaluated
+
+
 def get_answer(
     query: str, 
     model_choice: str, 
-    search_type: str
+    search_type: str,
+    k: Optional[int] = None,
+    num_candidates: Optional[int] = None,
+    defer_evaluation: Optional[bool] = None,
+    rewrite: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     Retrieves an answer to a query by performing a search and evaluating the response.
 
-    Depending on the `search_type`, the function either uses vector-based search or text-based search.
+    Depending on the `search_type`, the function uses vector-based, hybrid, rank-fused or text-based search.
     It then generates a prompt for the language model, retrieves the answer, evaluates its relevance,
     and calculates the associated costs and token usage.
 
+    A query similar enough to an earlier one answered with the same model, search type and settings is
+    answered from the semantic answer cache instead, see `lookup_cached_answer`.
+
     Args:
         query (str): The query for which an answer is sought.
         model_choice (str): The identifier for the model used to generate the answer.
-        search_type (str): The type of search to perform ('Vector' or 'Text').
+        search_type (str): The type of search to perform ('Vector', 'Hybrid', 'RRF' or 'Text').
+        k (Optional[int]): The number of documents retrieved as context. Defaults to SEARCH_K.
+        num_candidates (Optional[int]): The number of k-NN candidates considered by Vector, Hybrid and RRF search.
+            Defaults to RRF_NUM_CANDIDATES for RRF search and KNN_NUM_CANDIDATES otherwise.
+        defer_evaluation (Optional[bool]): Whether to return before the relevance is evaluated, see
+            `grade_answer`. Defaults to RELEVANCE_EVAL_MODE being 'deferred'.
+        rewrite (Optional[bool]): Whether to rewrite the query first, see `rewrite_query`. Defaults to None,
+            rewriting only queries that are not well formed.
 
     Returns:
         Dict[str, Any]: A dictionary containing:
@@ -389,41 +1233,35 @@ def get_answer(
             - 'eval_completion_tokens' (int): Number of tokens in the evaluation completion.
             - 'eval_total_tokens' (int): Total number of tokens used in the evaluation.
             - 'openai_cost' (float): Cost of the API usage based on the model choice and token usage.
+            - 'answer_id' (str): The id to save the answer with, so a deferred evaluation can be backfilled.
     """
-    # first clean the query to improve spelling and grammar and clarity
-    query = improve_query(query)
-    
-    # Search for the best matching knowledge base 
-    if search_type == 'Vector':
-        vector = model.encode(query)
-        search_results = elastic_search_knn('question_vector', vector)
-    if search_type == 'Hybrid':
-        vector = model.encode(query)
-        search_results = elastic_search_hybrid('question_vector', query, vector)
-    else:
-        search_results = elastic_search_text(query)
+    start_time = time.time()
+    k, num_candidates = resolve_search_settings(search_type, k, num_candidates)
+
+    # Reuse the answer to a similar earlier question, keyed by the raw query so the rewrite is skipped too
+    scope = (model_choice, search_type, k, num_candidates)
+    query_vector = embed_query(query) if answer_cache.enabled else None
+    if query_vector is not None:
+        cached = lookup_cached_answer(query_vector, scope, start_time)
+        if cached is not None:
+            return cached
+
+    # first clean the query to improve spelling and grammar and clarity, unless it is clean already,
+    # then search for the best matching knowledge base 
+    query, search_results = rewrite_and_search(query, search_type, k, num_candidates, rewrite)
 
     #build a prompt pass context to the LLM and get an answer
     prompt = build_prompt(query, search_results)
     answer, tokens, response_time = llm(prompt, model_choice)
     
-    # Evaluate the relevance of the answer
-    relevance, explanation, eval_tokens = evaluate_relevance(query, answer)
+    # Evaluate the relevance of the answer, now or in the background
+    answer_id = uuid.uuid4().hex
+    on_evaluated = cache_when_graded(query_vector, scope, answer, response_time, model_choice, tokens, answer_id)
+    relevance, explanation, eval_tokens = grade_answer(answer_id, query, answer, defer_evaluation, on_evaluated)
 
-    # Calculate cost
-    openai_cost = calculate_openai_cost(model_choice, tokens)
- 
-    return {
-        'answer': answer,
-        'response_time': response_time,
-        'relevance': relevance,
-        'relevance_explanation': explanation,
-        'model_used': model_choice,
-        'prompt_tokens': tokens['prompt_tokens'],
-        'completion_tokens': tokens['completion_tokens'],
-        'total_tokens': tokens['total_tokens'],
-        'eval_prompt_tokens': eval_tokens['prompt_tokens'],
-        'eval_completion_tokens': eval_tokens['completion_tokens'],
-        'eval_total_tokens': eval_tokens['total_tokens'],
-        'openai_cost': openai_cost
-    }
\ No newline at end of file
+    answer_data = build_answer_data(
+        answer, response_time, relevance, explanation, model_choice, tokens, eval_tokens, answer_id
+    )
+    if query_vector is not None:
+        cache_answer(query_vector, scope, answer_data)
+    return answer_data
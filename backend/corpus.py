@@ -0,0 +1,317 @@
+"""
+corpus.py
+
+This module streams the question-answer corpus into the ingestion pipeline without loading it into memory.
+
+Documents are parsed incrementally from either a JSON array of objects or JSON Lines (one object per line),
+read from a local file or a URL in fixed size chunks, and yielded one at a time. Memory use therefore stays
+flat regardless of the corpus size and indexing can start as soon as the first document has been read.
+
+A corpus source is either a local path or a URL. Remote corpora are downloaded once into a local cache and
+only revalidated with a conditional request (ETag / Last-Modified) when the cached copy is older than
+CORPUS_MAX_AGE, or never in offline mode, so unchanged corpora cost no download. Every resolved corpus
+gets a SHA-256 checksum, which can be pinned with CORPUS_SHA256.
+
+Functions:
+    - iter_json_documents: Incrementally parses documents from chunks of JSON or JSON Lines text.
+    - read_file_chunks: Reads a local file as text chunks.
+    - read_url_chunks: Downloads a URL as text chunks.
+    - file_sha256: Computes the checksum of a local file.
+    - fetch_cached_copy: Maintains a revalidated local copy of a remote corpus.
+    - resolve_corpus: Resolves a corpus source to a local file and its checksum.
+    - stream_documents: Streams documents from a local path or a URL.
+
+Environment Variables:
+    - CORPUS_CACHE_DIR: Directory for cached copies of remote corpora (default 'data/corpus'). Set it to an
+      empty string to stream remote corpora directly without caching.
+    - CORPUS_MAX_AGE: Seconds a cached copy is trusted before it is revalidated (default 3600).
+    - CORPUS_OFFLINE: 'true' to only ever use cached copies and never contact the remote server.
+    - CORPUS_SHA256: Expected SHA-256 checksum of the corpus, checked when set.
+"""
+
+import os
+import json
+import time
+import codecs
+import hashlib
+import requests
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+
+CORPUS_CACHE_DIR = os.getenv("CORPUS_CACHE_DIR", "data/corpus")
+CORPUS_MAX_AGE = int(os.getenv("CORPUS_MAX_AGE", "3600"))
+CORPUS_OFFLINE = os.getenv("CORPUS_OFFLINE", "false").lower() == "true"
+CORPUS_SHA256 = os.getenv("CORPUS_SHA256")
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Consumed text is dropped from the parse buffer once this many characters have piled up
+_BUFFER_COMPACT_SIZE = 1024 * 1024
+
+
+def iter_json_documents(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Incrementally parses JSON objects from a stream of text chunks.
+
+    The format is detected from the first non-whitespace character: a '[' starts a JSON array of
+    objects, anything else is read as JSON Lines. Chunk boundaries may fall anywhere, including in
+    the middle of a document.
+
+    Args:
+        chunks (Iterable[str]): The text of the corpus, split into chunks of any size.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The parsed documents, in order.
+
+    Raises:
+        ValueError: If the text is not a JSON array of objects or JSON Lines, including an array that is not
+            closed, for example a truncated file, or that is followed by more content.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    is_array = None
+    exhausted = False
+    # In an array, what comes next: the 'first' document or ']', a 'separator' (',' or ']') after a
+    # document, the 'next' document after a ',', or nothing but whitespace once the array is 'closed'
+    expected = "first"
+
+    while True:
+        # Skip whitespace between documents
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+
+        if position < len(buffer):
+            if is_array is None:
+                is_array = buffer[position] == "["
+                position += is_array
+                continue
+
+            if is_array:
+                char = buffer[position]
+                if expected == "closed":
+                    raise ValueError(f"Unexpected content after the end of the array: {buffer[position:position + 80]!r}")
+                if char == "]" and expected in ("first", "separator"):
+                    expected = "closed"
+                    position += 1
+                    continue
+                if expected == "separator":
+                    if char != ",":
+                        raise ValueError(f"Expected ',' or ']' after a document near: {buffer[position:position + 80]!r}")
+                    expected = "next"
+                    position += 1
+                    continue
+                if char in ",]":
+                    raise ValueError(f"Expected a document near: {buffer[position:position + 80]!r}")
+
+            try:
+                document, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The document continues in the next chunk
+                if exhausted:
+                    raise ValueError(f"Malformed corpus near: {buffer[position:position + 80]!r}")
+            else:
+                if not isinstance(document, dict):
+                    raise ValueError(f"Expected a JSON object, got {type(document).__name__}")
+                position = end
+                expected = "separator"
+                yield document
+                continue
+        elif exhausted:
+            if is_array and expected != "closed":
+                raise ValueError("The corpus ends before the closing ']' of the array, it may be truncated")
+            return
+
+        if position > _BUFFER_COMPACT_SIZE:
+            buffer, position = buffer[position:], 0
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+        else:
+            buffer += chunk
+
+
+def read_file_chunks(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Reads a UTF-8 encoded file as a sequence of text chunks.
+
+    Args:
+        path (str): The path of the file.
+        chunk_size (int): Number of characters per chunk. Defaults to READ_CHUNK_SIZE.
+
+    Returns:
+        Iterator[str]: The text of the file in chunks.
+    """
+    with open(path, encoding="utf-8") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def read_url_chunks(url: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Downloads a UTF-8 encoded resource as a sequence of text chunks without buffering the whole response.
+
+    Args:
+        url (str): The URL to download.
+        chunk_size (int): Number of bytes read per chunk. Defaults to READ_CHUNK_SIZE.
+
+    Returns:
+        Iterator[str]: The text of the response in chunks.
+
+    Raises:
+        requests.HTTPError: If the server responds with an error status.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def file_sha256(path: str) -> str:
+    """
+    Computes the SHA-256 checksum of a file without reading it into memory at once.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hex encoded checksum.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(READ_CHUNK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fetch_cached_copy(
+    url: str,
+    cache_dir: str = CORPUS_CACHE_DIR,
+    max_age: int = CORPUS_MAX_AGE,
+    offline: bool = CORPUS_OFFLINE
+) -> Tuple[str, str]:
+    """
+    Returns a local copy of a remote corpus, downloading or revalidating it only when needed.
+
+    The copy is used as is while it is younger than `max_age` seconds or in `offline` mode. Otherwise
+    the server is asked with a conditional request whether it changed, and the file is only downloaded
+    again if it did. If the server cannot be reached an existing copy is used.
+
+    Args:
+        url (str): The URL of the corpus.
+        cache_dir (str): The directory holding cached copies. Defaults to CORPUS_CACHE_DIR.
+        max_age (int): Seconds a copy is trusted without revalidation. Defaults to CORPUS_MAX_AGE.
+        offline (bool): Whether to never contact the server. Defaults to CORPUS_OFFLINE.
+
+    Returns:
+        Tuple[str, str]: The path of the local copy and its SHA-256 checksum.
+
+    Raises:
+        FileNotFoundError: If there is no cached copy in offline mode.
+        requests.RequestException: If the download fails and there is no cached copy.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    name = f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}-{os.path.basename(url.split('?')[0]) or 'corpus'}"
+    path = os.path.join(cache_dir, name)
+    meta_path = f"{path}.meta.json"
+
+    meta: Dict[str, Any] = {}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if meta and (offline or time.time() - meta["validated_at"] < max_age):
+        return path, meta["sha256"]
+    if offline:
+        raise FileNotFoundError(f"No cached copy of {url} in {cache_dir} and CORPUS_OFFLINE is set")
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+            response.raise_for_status()
+
+            if response.status_code == 304:
+                print(f"Cached corpus {path} is up to date")
+            else:
+                print(f"Downloading corpus to {path}...")
+                digest = hashlib.sha256()
+                with open(f"{path}.tmp", "wb") as f:
+                    for block in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                        digest.update(block)
+                        f.write(block)
+                os.replace(f"{path}.tmp", path)
+                meta = {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "sha256": digest.hexdigest(),
+                }
+    except requests.RequestException as e:
+        if not meta:
+            raise
+        print(f"Could not revalidate {url} ({e}), using cached copy")
+        return path, meta["sha256"]
+
+    meta["validated_at"] = time.time()
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return path, meta["sha256"]
+
+
+def resolve_corpus(source: str, expected_sha256: Optional[str] = CORPUS_SHA256) -> Tuple[str, Optional[str]]:
+    """
+    Resolves a corpus source to the location it is read from and its checksum.
+
+    Local paths are used directly. URLs resolve to a cached local copy, see `fetch_cached_copy`, or to
+    the URL itself when CORPUS_CACHE_DIR is empty, in which case no checksum is known upfront.
+
+    Args:
+        source (str): A local file path, or an 'http://' or 'https://' URL.
+        expected_sha256 (Optional[str]): The checksum the corpus must have. Defaults to CORPUS_SHA256.
+
+    Returns:
+        Tuple[str, Optional[str]]: The location to read the corpus from and its SHA-256 checksum.
+
+    Raises:
+        ValueError: If the checksum does not match `expected_sha256`.
+    """
+    if not _is_url(source):
+        location, checksum = source, file_sha256(source)
+    elif CORPUS_CACHE_DIR:
+        location, checksum = fetch_cached_copy(source)
+    else:
+        location, checksum = source, None
+
+    if expected_sha256 and checksum != expected_sha256.lower():
+        raise ValueError(f"Checksum mismatch for corpus {source}: expected {expected_sha256}, got {checksum}")
+    return location, checksum
+
+
+def stream_documents(source: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streams corpus documents from a local JSON or JSON Lines file, or directly from a URL.
+
+    Args:
+        source (str): A local file path, or an 'http://' or 'https://' URL, e.g. as returned by `resolve_corpus`.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The corpus documents, parsed lazily as the source is read.
+    """
+    if _is_url(source):
+        chunks = read_url_chunks(source)
+    else:
+        chunks = read_file_chunks(source)
+    return iter_json_documents(chunks)
@@ -7,16 +7,36 @@ indexes the documents into Elasticsearch for future retrieval and similarity-bas
 a local database.
 
 The following steps are carried out by this script:
-1. Fetch documents from a specified URL.
+1. Stream documents from a specified URL or local file.
 2. Load a sentence transformer model for embedding generation.
 3. Set up an Elasticsearch index with mappings for text and vector fields.
 4. Generate vector embeddings for each document's question and the combined question-answer.
-5. Index the documents and embeddings into Elasticsearch.
+5. Index the documents and embeddings into Elasticsearch using the bulk API.
 6. Initialize the local database after indexing.
 
+INDEX_NAME is an alias. A full ingest builds a new timestamped index version, atomically switches the
+alias to it once every document is indexed and then deletes old versions, so searches against INDEX_NAME
+keep being served by the previous version for the whole rebuild.
+
+While documents are loaded, refreshes and replicas are switched off for the target index. They are
+restored afterwards, and a rebuilt index version is force-merged into a single segment before it goes
+live, which speeds up both the load and kNN queries against the new version.
+
+Progress of a full ingest is checkpointed after every bulk chunk together with the corpus checksum. If a
+run dies, the next run over the same corpus and model continues writing into the unfinished index version
+after the last committed document instead of starting from scratch.
+
+After every successful run a snapshot of the live index is exported for the in-process search backend.
+
+In the 'incremental' ingest mode the existing index is kept: documents are compared with the indexed
+ones by content hash, only added or changed documents are embedded and indexed, and removed documents
+are deleted. Document ids are derived from the question and answer rather than the position in the
+corpus, so inserting or deleting a document does not shift the ids of the documents after it. An edited
+document gets a new id, it is indexed as added and its old version is deleted.
+
 Dependencies:
     - os
-    - requests
+    - corpus (custom module for streaming the corpus)
     - sentence_transformers
     - elasticsearch
     - tqdm
@@ -25,46 +45,91 @@ Dependencies:
 
 Environment Variables:
     - ELASTIC_URL: The Elasticsearch URL.
+    - CORPUS_SOURCE: URL or local path of the JSON or JSON Lines corpus (default DOCS_URL). Remote
+      corpora are cached locally, see corpus.py for the cache, revalidation and checksum settings.
     - MODEL_NAME: The name of the sentence transformer model to be used.
-    - INDEX_NAME: The name of the Elasticsearch index.
+    - INDEX_NAME: The name of the Elasticsearch index alias that is searched.
+    - INDEX_REPLICAS: Number of replicas of the index outside of bulk loads (default 0).
+    - BULK_LOAD_PROFILE: 'true' to disable refreshes and replicas during bulk loads (default), 'false' to keep them.
+    - FORCE_MERGE_TIMEOUT: Seconds to wait for the force-merge after a rebuild (default 3600).
+    - CHECKPOINT_PATH: File recording the progress of a full ingest (default 'data/ingest_checkpoint.json').
+    - INDEX_VERSIONS_TO_KEEP: Number of index versions kept after a rebuild, including the live one (default 2).
+    - INGEST_MODE: 'full' to rebuild the index (default) or 'incremental' to sync it with the corpus.
+    - ENCODE_BATCH_SIZE: Number of documents embedded per model call (default 64).
+    - EMBED_WORKERS: Number of embedding processes, each with its own model (default 1, in-process).
+    - EMBEDDING_CACHE_DIR: Directory of the persistent embedding cache, empty to disable (see embedding_cache.py).
+    - LOCAL_INDEX_DIR: Directory of the in-process search snapshot, empty to disable (see local_index.py).
+    - BULK_CHUNK_SIZE: Number of documents sent per bulk request (default 500).
+    - BULK_THREAD_COUNT: Number of bulk requests sent in parallel (default 4).
+    - BULK_MAX_RETRIES: Retries for documents rejected with HTTP 429 (default 3).
 """
 
 
 import os
-import requests
+import re
+import json
+import time
+import hashlib
+import multiprocessing
+from datetime import datetime, timezone
+import numpy as np
+import torch
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 from sentence_transformers import SentenceTransformer
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 from tqdm.auto import tqdm
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from corpus import resolve_corpus, stream_documents
 from database import init_db
+from embedding_cache import EMBEDDING_CACHE_DIR, EmbeddingCache
+from local_index import LOCAL_INDEX_DIR, export_snapshot
 
 load_dotenv()
 
 ELASTIC_URL = os.getenv("ELASTIC_URL")
 MODEL_NAME = os.getenv("MODEL_NAME")
 INDEX_NAME = os.getenv("INDEX_NAME")
+INGEST_MODE = os.getenv("INGEST_MODE", "full")
+INDEX_REPLICAS = int(os.getenv("INDEX_REPLICAS", "0"))
+BULK_LOAD_PROFILE = os.getenv("BULK_LOAD_PROFILE", "true").lower() == "true"
+FORCE_MERGE_TIMEOUT = int(os.getenv("FORCE_MERGE_TIMEOUT", "3600"))
+INDEX_VERSIONS_TO_KEEP = int(os.getenv("INDEX_VERSIONS_TO_KEEP", "2"))
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "data/ingest_checkpoint.json")
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_THREAD_COUNT = int(os.getenv("BULK_THREAD_COUNT", "4"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "3"))
 
 DOCS_URL = "https://raw.githubusercontent.com/Kent0n-Li/ChatDoctor/main/chatdoctor5k.json"
+CORPUS_SOURCE = os.getenv("CORPUS_SOURCE", DOCS_URL)
 
 
-def fetch_documents() -> List[Dict[str, str]]:
+def fetch_documents(source: str = CORPUS_SOURCE) -> Tuple[Iterator[Dict[str, str]], Optional[str]]:
     """
-    Fetches the documents from the specified URL.
+    Streams the documents from the specified URL or local file.
+
+    Remote sources are read from a local copy that is only downloaded again when the source changed.
+    The corpus is parsed incrementally, as a JSON array or as JSON Lines, so documents are yielded
+    to the pipeline as soon as they are read and the corpus is never held in memory.
 
-    This function makes a GET request to the URL defined by DOCS_URL to fetch a list of
-    question-answer documents in JSON format.
+    Args:
+        source (str): URL or local path of the corpus. Defaults to CORPUS_SOURCE.
 
     Returns:
-        list: A list of dictionaries, each containing 'id', 'question', and 'answer'.
+        Tuple[Iterator[Dict[str, str]], Optional[str]]: The question-answer documents, each containing
+        'input' and 'output', and the SHA-256 checksum of the corpus if it is known upfront.
     """
     
     print("Fetching documents...")
-    docs_response = requests.get(DOCS_URL)
-    documents = docs_response.json()
-    print(f"Fetched {len(documents)} documents")
-    return documents
+    location, checksum = resolve_corpus(source)
+    print(f"Streaming documents from {location} (sha256: {checksum or 'unknown'})")
+    return stream_documents(location), checksum
 
 
 def load_model() -> SentenceTransformer:
@@ -72,7 +137,24 @@ def load_model() -> SentenceTransformer:
     return SentenceTransformer(MODEL_NAME)
 
 
-def setup_elasticsearch() -> Elasticsearch:
+def load_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Opens the persistent embedding cache for MODEL_NAME and evicts the embeddings of any other model.
+
+    Returns:
+        Optional[EmbeddingCache]: The cache, or None if EMBEDDING_CACHE_DIR is empty.
+    """
+    if not EMBEDDING_CACHE_DIR:
+        return None
+
+    cache = EmbeddingCache(MODEL_NAME, EMBEDDING_CACHE_DIR)
+    for model_name in cache.evict_stale_models():
+        print(f"Evicted cached embeddings of model: {model_name}")
+    print(f"Loaded embedding cache with {len(cache)} entries")
+    return cache
+
+
+def setup_elasticsearch(recreate: bool = True) -> Tuple[Elasticsearch, str]:
     """
     Set up an Elasticsearch index for storing question-answer pairs along with vector representations of:
     1. The question alone (question_vector).
@@ -84,10 +166,17 @@ def setup_elasticsearch() -> Elasticsearch:
     - One vector for the question.
     - Another vector for the concatenation of the question and answer.
 
-    The function deletes the existing index (if any) with the same name before creating the new one.
+    The function creates a new index version named after INDEX_NAME and the current time. The live index
+    behind the INDEX_NAME alias is left untouched until `publish_index` switches the alias to the new version.
+    With `recreate` set to False the index behind the alias is reused, and a first version is created
+    and published only if there is none yet.
+
+    Args:
+        recreate (bool): Whether to create a new index version rather than reuse the live one. Defaults to True.
 
     Returns:
-        Elasticsearch: The client instance connected to the Elasticsearch cluster.
+        Tuple[Elasticsearch, str]: The client instance connected to the Elasticsearch cluster and the name
+        of the index to write documents to.
 
     Raises:
         ElasticsearchException: If there is an error creating or interacting with the index.
@@ -96,12 +185,13 @@ def setup_elasticsearch() -> Elasticsearch:
     es_client = Elasticsearch(ELASTIC_URL)
 
     index_settings = {
-        "settings": {"number_of_shards": 1, "number_of_replicas": 0},
+        "settings": {"number_of_shards": 1, "number_of_replicas": INDEX_REPLICAS},
         "mappings": {
             "properties": {
                 "id": {"type": "keyword"},
                 "question": {"type": "text"},
                 "answer": {"type": "text"},
+                "content_hash": {"type": "keyword"},
                 "question_vector": {
                     "type": "dense_vector",
                     "dims": 384,  # Assuming you're using a vector of size 384
@@ -118,51 +208,700 @@ def setup_elasticsearch() -> Elasticsearch:
         },
     }
 
-    # Delete the existing index if it exists
-    es_client.indices.delete(index=INDEX_NAME, ignore_unavailable=True)
-    
-    # Create a new index with the provided settings
-    es_client.indices.create(index=INDEX_NAME, body=index_settings)
-    
-    print(f"Elasticsearch index '{INDEX_NAME}' created")
-    return es_client
+    if not recreate and es_client.indices.exists(index=INDEX_NAME):
+        print(f"Using existing Elasticsearch index '{INDEX_NAME}'")
+        return es_client, INDEX_NAME
 
+    # Create a new index version with the provided settings
+    index_name = f"{INDEX_NAME}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+    es_client.indices.create(index=index_name, body=index_settings)
+    print(f"Elasticsearch index '{index_name}' created")
 
-def index_documents(es_client: Elasticsearch, documents: List[Dict[str, str]], model: SentenceTransformer) -> None:
+    if not recreate:
+        publish_index(es_client, index_name)
+    return es_client, index_name
+
+
+@contextmanager
+def bulk_load_profile(
+    es_client: Elasticsearch,
+    index_name: str,
+    force_merge: bool = True,
+    drop_replicas: bool = True
+) -> Iterator[Dict[str, float]]:
     """
-    Index a list of documents into the Elasticsearch database.
+    Tunes an index for a bulk load for the duration of the `with` block.
 
-    Each document should contain an 'input' and 'output' field. The function renames 
-    'input' to 'question', 'output' to 'answer', and excludes the 'instruction' field 
-    from indexing. It also assigns an ascending number as the unique 'id' for each document.
+    Refreshes are disabled and, with `drop_replicas`, replicas are dropped while documents are loaded, and
+    the previous settings are restored when the block exits. If the block succeeds the index is refreshed and,
+    with `force_merge`, merged down to one segment. The duration of every step in seconds is stored
+    in the yielded dictionary and printed at the end.
 
     Args:
         es_client (Elasticsearch): The Elasticsearch client instance.
-        documents (list of dict): The list of documents to be indexed, each containing 'input' and 'output'.
-        model (SentenceTransformer): The model to use for generating vector embeddings.
+        index_name (str): The index or alias that is loaded.
+        force_merge (bool): Whether to force-merge the index after the load. Defaults to True.
+        drop_replicas (bool): Whether to drop the replicas during the load. Keep them on an index that serves
+            searches, restoring them would copy every shard again. Defaults to True.
+
+    Returns:
+        Iterator[Dict[str, float]]: The timings of the 'load', 'restore', 'refresh' and 'force_merge' steps.
+    """
+    timings: Dict[str, float] = {}
+    if not BULK_LOAD_PROFILE:
+        yield timings
+        return
+
+    response = es_client.indices.get_settings(
+        index=index_name, name=["index.refresh_interval", "index.number_of_replicas"], flat_settings=True
+    )
+    current = next(iter(response.body.values()))["settings"]
+
+    load_settings = {"refresh_interval": "-1", "number_of_replicas": 0} if drop_replicas else {"refresh_interval": "-1"}
+    es_client.indices.put_settings(index=index_name, settings=load_settings)
+    print(f"Disabled {'refresh and replicas' if drop_replicas else 'refresh'} on '{index_name}' for the bulk load")
+
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["load"] = time.perf_counter() - start
+
+        # A missing refresh_interval means the default, restoring None resets it to that. Refresh
+        # already being off means an interrupted load is resumed, so restore the configured values.
+        restored = {
+            "refresh_interval": current.get("index.refresh_interval"),
+            "number_of_replicas": current.get("index.number_of_replicas", INDEX_REPLICAS),
+        }
+        if restored["refresh_interval"] == "-1":
+            restored = {"refresh_interval": None, "number_of_replicas": INDEX_REPLICAS}
+        if not drop_replicas:
+            del restored["number_of_replicas"]
+
+        start = time.perf_counter()
+        es_client.indices.put_settings(index=index_name, settings=restored)
+        timings["restore"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    es_client.indices.refresh(index=index_name)
+    timings["refresh"] = time.perf_counter() - start
+
+    if force_merge:
+        start = time.perf_counter()
+        es_client.options(request_timeout=FORCE_MERGE_TIMEOUT).indices.forcemerge(index=index_name, max_num_segments=1)
+        timings["force_merge"] = time.perf_counter() - start
+
+    print("Bulk load timings: " + ", ".join(f"{step} {seconds:.1f}s" for step, seconds in timings.items()))
+
+
+def get_live_indices(es_client: Elasticsearch) -> List[str]:
+    """
+    Lists the indices the INDEX_NAME alias currently points to.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+
+    Returns:
+        List[str]: The index names, empty if the alias does not exist.
+    """
+    if not es_client.indices.exists_alias(name=INDEX_NAME):
+        return []
+    return list(es_client.indices.get_alias(name=INDEX_NAME).body)
+
+
+def publish_index(es_client: Elasticsearch, index_name: str) -> None:
+    """
+    Atomically points the INDEX_NAME alias at a new index version and removes old versions.
+
+    Searches against INDEX_NAME switch from the previous version to `index_name` in a single
+    cluster state update, so there is no moment without a searchable index. An index that was
+    created under the plain INDEX_NAME before aliases were used is removed in the same update.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+        index_name (str): The index version to publish.
 
     Returns:
         None
     """
-    print("Indexing documents...")
-    for idx, doc in enumerate(tqdm(documents), start=1):
+    previous = get_live_indices(es_client)
+    actions = [{"remove": {"index": index, "alias": INDEX_NAME}} for index in previous]
+    if not actions and es_client.indices.exists(index=INDEX_NAME):
+        actions.append({"remove_index": {"index": INDEX_NAME}})
+    actions.append({"add": {"index": index_name, "alias": INDEX_NAME}})
+
+    es_client.indices.update_aliases(actions=actions)
+    print(f"Alias '{INDEX_NAME}' now points to '{index_name}'")
+
+    cleanup_index_versions(es_client, previous=previous)
+
+
+def cleanup_index_versions(
+    es_client: Elasticsearch,
+    keep: int = INDEX_VERSIONS_TO_KEEP,
+    previous: Iterable[str] = ()
+) -> List[str]:
+    """
+    Deletes old index versions, keeping the live version and up to `keep` versions in total.
+
+    The versions that were live before the last publish are kept first, so a rollback goes to the version
+    that served searches rather than to a newer one that was abandoned half loaded. The remaining slots go
+    to the newest versions. Only indices named like the versions `setup_elasticsearch` creates,
+    INDEX_NAME followed by a 14 digit timestamp, are considered.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+        keep (int): Number of index versions to keep, including the live one. Defaults to INDEX_VERSIONS_TO_KEEP.
+        previous (Iterable[str]): The versions that were live before the last publish. Defaults to none.
+
+    Returns:
+        List[str]: The names of the deleted indices.
+    """
+    live = set(get_live_indices(es_client))
+    pattern = re.compile(rf"^{re.escape(INDEX_NAME)}-\d{{14}}$")
+    candidates = es_client.indices.get(index=f"{INDEX_NAME}-*", expand_wildcards="open,closed").body
+    versions = sorted((index for index in candidates if pattern.match(index)), reverse=True)
+
+    previous = set(previous)
+    kept = [index for index in versions if index in live]
+    rollback = [index for index in versions if index in previous] + [index for index in versions if index not in previous]
+    kept += [index for index in rollback if index not in kept][:max(0, keep - len(kept))]
+
+    deleted = [index for index in versions if index not in kept]
+    for index in deleted:
+        es_client.indices.delete(index=index, ignore_unavailable=True)
+        print(f"Deleted old index version '{index}'")
+    return deleted
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Splits an iterable into lists of at most `size` items without materialising the whole iterable.
+
+    Args:
+        iterable (Iterable[Any]): The items to split.
+        size (int): The maximum number of items per chunk.
+
+    Returns:
+        Iterator[List[Any]]: An iterator over the chunks.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def document_hash(question: str, answer: str) -> str:
+    """
+    Computes the content hash of a document, used to detect added or changed documents.
+
+    MODEL_NAME is part of the hash so that switching models re-embeds every document.
+
+    Args:
+        question (str): The question of the document.
+        answer (str): The answer of the document.
+
+    Returns:
+        str: The hex encoded SHA-256 digest of the model name, question and answer.
+    """
+    content = "\x1f".join([MODEL_NAME or "", question, answer])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def document_id(question: str, answer: str) -> str:
+    """
+    Derives the id of a document from its content, so it does not depend on the position in the corpus.
+
+    Args:
+        question (str): The question of the document.
+        answer (str): The answer of the document.
+
+    Returns:
+        str: The first 16 hex digits of the SHA-256 digest of the question and answer.
+    """
+    content = "\x1f".join([question, answer])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def prepare_documents(documents: Iterable[Dict[str, str]]) -> Iterator[Dict[str, Any]]:
+    """
+    Converts raw corpus documents into the shape stored in Elasticsearch, without the embeddings.
+
+    Each document should contain an 'input' and 'output' field. The function renames 
+    'input' to 'question', 'output' to 'answer', and excludes the 'instruction' field 
+    from indexing. It also assigns each document an 'id' derived from its content, see
+    `document_id`, and adds its 'content_hash'.
+
+    Args:
+        documents (Iterable[Dict[str, str]]): The corpus documents, each containing 'input' and 'output'.
+
+    Returns:
+        Iterator[Dict[str, Any]]: Documents with 'id', 'question', 'answer' and 'content_hash'.
+    """
+    for doc in documents:
         # Rename fields
         question = doc["input"]
         answer = doc["output"]
 
-        # Prepare document for indexing
-        indexed_doc = {
-            "id": idx,  # Assign a unique ascending number as the document ID
+        yield {
+            "id": document_id(question, answer),
             "question": question,
             "answer": answer,
-            "question_vector": model.encode(question).tolist(),  # Embedding for the question alone
-            "question_answer_vector": model.encode(question + " " + answer).tolist()  # Embedding for both question and answer
+            "content_hash": document_hash(question, answer),
         }
 
-        # Index the document into Elasticsearch
-        es_client.index(index=INDEX_NAME, document=indexed_doc, id=idx)  # Use the same id for indexing
 
-    print(f"Indexed {len(documents)} documents")
+def batch_texts(batch: List[Dict[str, Any]]) -> List[str]:
+    """
+    Lists the texts that are embedded for a batch of documents.
+
+    Args:
+        batch (List[Dict[str, Any]]): Prepared documents, each containing 'question' and 'answer'.
+
+    Returns:
+        List[str]: The question of every document, followed by the question+answer of every document.
+    """
+    questions = [doc["question"] for doc in batch]
+    question_answers = [doc["question"] + " " + doc["answer"] for doc in batch]
+    return questions + question_answers
+
+
+def encode_texts(model: SentenceTransformer, texts: List[str]) -> np.ndarray:
+    """
+    Generates embeddings for a list of texts with a single model call.
+
+    Encoding the texts together lets the SentenceTransformer sort and pad the whole batch at once
+    instead of running one forward pass per string.
+
+    Args:
+        model (SentenceTransformer): The model to use for generating vector embeddings.
+        texts (List[str]): The texts to embed.
+
+    Returns:
+        np.ndarray: The embeddings, one row per text.
+    """
+    return model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+
+# Model owned by an embedding worker process, loaded once by _init_embedding_worker
+_worker_model: Optional[SentenceTransformer] = None
+
+
+def _init_embedding_worker(model_name: str, torch_threads: int) -> None:
+    global _worker_model
+    # Split the cores between workers instead of letting every process use all of them
+    torch.set_num_threads(torch_threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_texts_in_worker(texts: List[str]) -> np.ndarray:
+    return encode_texts(_worker_model, texts)
+
+
+def _complete_batch(
+    entry: Tuple[List[Dict[str, Any]], List[str], List[Optional[np.ndarray]], List[str], Any],
+    cache: Optional[EmbeddingCache]
+) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray]:
+    batch, texts, cached, missing, encoded = entry
+    if isinstance(encoded, Future):
+        encoded = encoded.result()
+
+    fresh = dict(zip(missing, encoded))
+    if cache is not None and missing:
+        cache.put_many(missing, encoded)
+
+    vectors = np.stack([fresh[text] if vector is None else vector for text, vector in zip(texts, cached)])
+    return batch, vectors[:len(batch)], vectors[len(batch):]
+
+
+def encode_documents(
+    documents: Iterable[Dict[str, Any]],
+    model: Optional[SentenceTransformer],
+    batch_size: int = ENCODE_BATCH_SIZE,
+    workers: int = EMBED_WORKERS,
+    cache: Optional[EmbeddingCache] = None
+) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray]]:
+    """
+    Embeds a stream of documents batch by batch, either in-process or on a pool of worker processes.
+
+    With `workers` greater than one, batches are fanned out to a process pool where every worker
+    loads its own copy of MODEL_NAME, and `model` may be None. At most two batches per worker are
+    in flight, and results are yielded in the original document order.
+
+    When a `cache` is given, only texts missing from it are sent to the model and the new
+    embeddings are added to it.
+
+    Args:
+        documents (Iterable[Dict[str, Any]]): Prepared documents, each containing 'question' and 'answer'.
+        model (Optional[SentenceTransformer]): The model used when embedding in-process.
+        batch_size (int): Number of documents embedded per model call. Defaults to ENCODE_BATCH_SIZE.
+        workers (int): Number of embedding processes. Defaults to EMBED_WORKERS.
+        cache (Optional[EmbeddingCache]): The embedding cache to read from and write to. Defaults to None.
+
+    Returns:
+        Iterator[Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray]]: Each batch of documents together
+        with its question vectors and question+answer vectors.
+    """
+    executor = None
+    max_in_flight = 0
+    if workers > 1:
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"Embedding with {workers} worker processes ({torch_threads} threads each)")
+
+        # Spawn rather than fork, the parent already runs the bulk indexing threads
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_embedding_worker,
+            initargs=(MODEL_NAME, torch_threads),
+        )
+        max_in_flight = workers * 2
+
+    try:
+        pending = deque()
+        for batch in chunked(documents, batch_size):
+            texts = batch_texts(batch)
+            cached = cache.get_many(texts) if cache is not None else [None] * len(texts)
+            missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+
+            if not missing:
+                encoded = []
+            elif executor is None:
+                encoded = encode_texts(model, missing)
+            else:
+                encoded = executor.submit(_encode_texts_in_worker, missing)
+            pending.append((batch, texts, cached, missing, encoded))
+
+            while len(pending) > max_in_flight:
+                yield _complete_batch(pending.popleft(), cache)
+        while pending:
+            yield _complete_batch(pending.popleft(), cache)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def generate_actions(
+    documents: Iterable[Dict[str, Any]], 
+    model: Optional[SentenceTransformer],
+    batch_size: int = ENCODE_BATCH_SIZE,
+    workers: int = EMBED_WORKERS,
+    cache: Optional[EmbeddingCache] = None,
+    index_name: str = INDEX_NAME
+) -> Iterator[Dict[str, Any]]:
+    """
+    Generates Elasticsearch bulk index actions for a stream of prepared documents.
+
+    Documents are consumed and embedded `batch_size` at a time, see `encode_documents`, and
+    indexed under their 'id'.
+
+    Args:
+        documents (Iterable[Dict[str, Any]]): Prepared documents, see `prepare_documents`.
+        model (Optional[SentenceTransformer]): The model to use for generating vector embeddings in-process.
+        batch_size (int): Number of documents embedded per model call. Defaults to ENCODE_BATCH_SIZE.
+        workers (int): Number of embedding processes. Defaults to EMBED_WORKERS.
+        cache (Optional[EmbeddingCache]): The embedding cache to read from and write to. Defaults to None.
+        index_name (str): The index to write to. Defaults to INDEX_NAME.
+
+    Returns:
+        Iterator[Dict[str, Any]]: Bulk actions ready to be passed to the Elasticsearch bulk helpers.
+    """
+    for batch, question_vectors, question_answer_vectors in encode_documents(documents, model, batch_size, workers, cache):
+        for doc, question_vector, question_answer_vector in zip(batch, question_vectors, question_answer_vectors):
+            yield {
+                "_index": index_name,
+                "_id": doc["id"],  # Use the same id for indexing
+                "_source": {
+                    **doc,
+                    "question_vector": question_vector.tolist(),  # Embedding for the question alone
+                    "question_answer_vector": question_answer_vector.tolist()  # Embedding for both question and answer
+                },
+            }
+
+
+def bulk_index_chunk(
+    es_client: Elasticsearch, 
+    chunk_number: int, 
+    actions: List[Dict[str, Any]]
+) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """
+    Sends a single chunk of actions to Elasticsearch with one bulk request.
+
+    Transport errors and rejected documents are collected rather than raised so that one bad chunk
+    does not abort the whole ingestion run.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+        chunk_number (int): The position of the chunk in the ingestion run, used for error reporting.
+        actions (List[Dict[str, Any]]): The bulk actions in this chunk.
+
+    Returns:
+        Tuple[int, int, List[Dict[str, Any]]]: The chunk number, the number of successfully indexed
+        documents and the list of per-document errors.
+    """
+    success, errors = helpers.bulk(
+        es_client,
+        actions,
+        chunk_size=len(actions),
+        max_retries=BULK_MAX_RETRIES,
+        raise_on_error=False,
+        raise_on_exception=False,
+    )
+    return chunk_number, success, errors
+
+
+def index_documents(
+    es_client: Elasticsearch, 
+    documents: Iterable[Dict[str, Any]], 
+    model: Optional[SentenceTransformer],
+    chunk_size: int = BULK_CHUNK_SIZE,
+    thread_count: int = BULK_THREAD_COUNT,
+    batch_size: int = ENCODE_BATCH_SIZE,
+    workers: int = EMBED_WORKERS,
+    cache: Optional[EmbeddingCache] = None,
+    index_name: str = INDEX_NAME,
+    on_progress: Optional[Callable[[int], None]] = None
+) -> Dict[str, int]:
+    """
+    Index a stream of prepared documents into the Elasticsearch database using the bulk API.
+
+    Documents are embedded in batches of `batch_size`, in the calling thread or on `workers` embedding
+    processes, and grouped into chunks of `chunk_size` actions. Each chunk is sent as one bulk request
+    from a shared pool of `thread_count` worker threads, so embedding and indexing overlap and the run
+    is bound by network throughput rather than per-request latency. Texts found in `cache` are not re-embedded.
+    Failed documents are reported per chunk and do not stop the run.
+
+    Chunks can finish out of order, so progress is tracked as the number of leading documents that are
+    committed without errors. `on_progress` is called with that number whenever it grows.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+        documents (Iterable[Dict[str, Any]]): Prepared documents to be indexed, see `prepare_documents`.
+        model (Optional[SentenceTransformer]): The model to use for generating vector embeddings in-process.
+            May be None when `workers` is greater than one.
+        chunk_size (int): Number of documents sent per bulk request. Defaults to BULK_CHUNK_SIZE.
+        thread_count (int): Number of bulk requests in flight at once. Defaults to BULK_THREAD_COUNT.
+        batch_size (int): Number of documents embedded per model call. Defaults to ENCODE_BATCH_SIZE.
+        workers (int): Number of embedding processes. Defaults to EMBED_WORKERS.
+        cache (Optional[EmbeddingCache]): The embedding cache to read from and write to. Defaults to None.
+        index_name (str): The index to write to. Defaults to INDEX_NAME.
+        on_progress (Optional[Callable[[int], None]]): Called with the number of leading documents that are
+            committed. Defaults to None.
+
+    Returns:
+        Dict[str, int]: The number of 'indexed', 'failed' and leading 'committed' documents.
+    """
+    print("Indexing documents...")
+    stats = {"indexed": 0, "failed": 0, "committed": 0}
+    finished_chunks: Dict[int, Tuple[int, bool]] = {}
+    next_chunk = 1
+
+    def collect(futures) -> None:
+        nonlocal next_chunk
+        for future in futures:
+            chunk_number, success, errors = future.result()
+            stats["indexed"] += success
+            stats["failed"] += len(errors)
+            finished_chunks[chunk_number] = (success + len(errors), not errors)
+            if errors:
+                print(f"Chunk {chunk_number}: {len(errors)} documents failed, first error: {errors[0]}")
+
+        # Advance over the finished chunks that directly follow the committed ones, stopping at a failed chunk
+        committed = stats["committed"]
+        while finished_chunks.get(next_chunk, (0, False))[1]:
+            committed += finished_chunks.pop(next_chunk)[0]
+            next_chunk += 1
+        if committed > stats["committed"]:
+            stats["committed"] = committed
+            if on_progress is not None:
+                on_progress(committed)
+
+    actions = generate_actions(tqdm(documents), model, batch_size, workers, cache, index_name)
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        pending = set()
+        for chunk_number, chunk in enumerate(chunked(actions, chunk_size), start=1):
+            pending.add(executor.submit(bulk_index_chunk, es_client, chunk_number, chunk))
+
+            # Bound the number of chunks held in memory while waiting on Elasticsearch
+            if len(pending) >= thread_count * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(pending)
+
+    print(f"Indexed {stats['indexed']} documents, {stats['failed']} failed")
+    return stats
+
+
+def fetch_indexed_hashes(es_client: Elasticsearch) -> Dict[str, Optional[str]]:
+    """
+    Retrieves the content hash of every document currently in the index.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+
+    Returns:
+        Dict[str, Optional[str]]: The content hash by document id. Documents indexed before content
+        hashes were stored map to None.
+    """
+    hits = helpers.scan(es_client, index=INDEX_NAME, query={"_source": ["content_hash"]}, size=BULK_CHUNK_SIZE)
+    return {hit["_id"]: hit["_source"].get("content_hash") for hit in hits}
+
+
+def sync_documents(
+    es_client: Elasticsearch, 
+    documents: Iterable[Dict[str, str]], 
+    model: Optional[SentenceTransformer],
+    cache: Optional[EmbeddingCache] = None
+) -> Dict[str, int]:
+    """
+    Brings the existing index in line with the corpus without rebuilding it.
+
+    Documents whose content hash matches the indexed copy are skipped, added or changed documents
+    are embedded and indexed, and indexed documents that are no longer in the corpus are deleted.
+
+    When anything changed, the sync time is stored in the '_meta' of the index mapping, so the backend can
+    tell that the content of the index changed although its name did not.
+
+    Document ids are derived from the content, see `document_id`, so an edited document counts as added
+    and its old version as deleted. Documents only count as changed when MODEL_NAME changed. An index built
+    with the positional ids of earlier versions is replaced entirely by the first sync.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+        documents (Iterable[Dict[str, str]]): The corpus documents, each containing 'input' and 'output'.
+        model (Optional[SentenceTransformer]): The model to use for generating vector embeddings in-process.
+        cache (Optional[EmbeddingCache]): The embedding cache to read from and write to. Defaults to None.
+
+    Returns:
+        Dict[str, int]: The number of 'unchanged', 'added', 'changed', 'deleted' and 'failed' documents.
+    """
+    print("Comparing corpus with the indexed documents...")
+    indexed_hashes = fetch_indexed_hashes(es_client)
+    stats = {"unchanged": 0, "added": 0, "changed": 0, "deleted": 0}
+    seen_ids = set()
+
+    def modified_documents() -> Iterator[Dict[str, Any]]:
+        for doc in prepare_documents(documents):
+            doc_id = doc["id"]
+            if doc_id in seen_ids:
+                continue  # A duplicate of a document earlier in the corpus
+            seen_ids.add(doc_id)
+            if doc_id not in indexed_hashes:
+                stats["added"] += 1
+            elif indexed_hashes[doc_id] != doc["content_hash"]:
+                stats["changed"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            yield doc
+
+    # Merging the live index would compete with searches, leave that to Elasticsearch, and keep its replicas
+    # serving searches instead of recovering them from scratch afterwards
+    with bulk_load_profile(es_client, INDEX_NAME, force_merge=False, drop_replicas=False):
+        index_stats = index_documents(es_client, modified_documents(), model, cache=cache)
+
+    removed_ids = [doc_id for doc_id in indexed_hashes if doc_id not in seen_ids]
+    if removed_ids:
+        delete_actions = ({"_op_type": "delete", "_index": INDEX_NAME, "_id": doc_id} for doc_id in removed_ids)
+        deleted, errors = helpers.bulk(
+            es_client, delete_actions, chunk_size=BULK_CHUNK_SIZE, raise_on_error=False, ignore_status=404
+        )
+        stats["deleted"] = deleted
+        if errors:
+            print(f"Failed to delete {len(errors)} documents, first error: {errors[0]}")
+
+    stats["failed"] = index_stats["failed"]
+    if stats["added"] or stats["changed"] or stats["deleted"]:
+        # The live index keeps its name, so mark the new content for the answer cache of the backend
+        es_client.indices.put_mapping(index=INDEX_NAME, meta={"synced_at": time.time()})
+    print(
+        f"Sync finished: {stats['added']} added, {stats['changed']} changed, "
+        f"{stats['deleted']} deleted, {stats['unchanged']} unchanged"
+    )
+    return stats
+
+
+def load_checkpoint() -> Optional[Dict[str, Any]]:
+    """
+    Loads the checkpoint of an interrupted full ingest.
+
+    Returns:
+        Optional[Dict[str, Any]]: The checkpoint with 'corpus_hash', 'model_name', 'index_name' and
+        'committed_documents', or None if there is none.
+    """
+    if not CHECKPOINT_PATH or not os.path.exists(CHECKPOINT_PATH):
+        return None
+    with open(CHECKPOINT_PATH) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint: Dict[str, Any]) -> None:
+    """
+    Atomically writes the checkpoint of the running full ingest.
+
+    Args:
+        checkpoint (Dict[str, Any]): The checkpoint, see `load_checkpoint`.
+
+    Returns:
+        None
+    """
+    if not CHECKPOINT_PATH:
+        return
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH) or ".", exist_ok=True)
+    with open(f"{CHECKPOINT_PATH}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{CHECKPOINT_PATH}.tmp", CHECKPOINT_PATH)
+
+
+def clear_checkpoint() -> None:
+    """
+    Removes the checkpoint once a full ingest has been published.
+
+    Returns:
+        None
+    """
+    if CHECKPOINT_PATH and os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+
+
+def resume_or_setup_index(corpus_hash: Optional[str]) -> Tuple[Elasticsearch, Dict[str, Any]]:
+    """
+    Picks up an interrupted full ingest of the same corpus, or sets up a new index version.
+
+    A checkpoint is only resumed if it was written for the same corpus checksum and MODEL_NAME and
+    its index version still exists. Without a known corpus checksum nothing is resumed or recorded.
+
+    Args:
+        corpus_hash (Optional[str]): The SHA-256 checksum of the corpus.
+
+    Returns:
+        Tuple[Elasticsearch, Dict[str, Any]]: The client instance connected to the Elasticsearch cluster
+        and the checkpoint of the run, see `load_checkpoint`.
+    """
+    checkpoint = load_checkpoint()
+    if (
+        checkpoint
+        and corpus_hash
+        and checkpoint["corpus_hash"] == corpus_hash
+        and checkpoint["model_name"] == MODEL_NAME
+    ):
+        es_client = Elasticsearch(ELASTIC_URL)
+        if es_client.indices.exists(index=checkpoint["index_name"]):
+            print(
+                f"Resuming ingestion into '{checkpoint['index_name']}' "
+                f"after {checkpoint['committed_documents']} documents"
+            )
+            return es_client, checkpoint
+
+    es_client, index_name = setup_elasticsearch()
+    checkpoint = {
+        "corpus_hash": corpus_hash,
+        "model_name": MODEL_NAME,
+        "index_name": index_name,
+        "committed_documents": 0,
+    }
+    if corpus_hash:
+        save_checkpoint(checkpoint)
+    return es_client, checkpoint
 
 
 def main() -> None:
@@ -170,11 +909,13 @@ def main() -> None:
         Main function to coordinate the document indexing process.
 
         This function orchestrates the following:
-        1. Fetches the documents from an external source.
+        1. Streams the documents from an external source.
         2. Loads the pre-trained model for embedding generation.
-        3. Sets up the Elasticsearch index.
-        4. Indexes the fetched documents into Elasticsearch.
-        5. Initializes the local database.
+        3. Sets up a new Elasticsearch index version, or resumes an interrupted one.
+        4. Indexes the fetched documents into it and switches the INDEX_NAME alias over, or syncs
+           them with the live index when INGEST_MODE is 'incremental'.
+        5. Exports a snapshot for the in-process search backend.
+        6. Initializes the local database.
 
         Returns:
             None
@@ -182,10 +923,47 @@ def main() -> None:
     
     print("Starting the indexing process...")
 
-    documents = fetch_documents()
-    model = load_model()
-    es_client = setup_elasticsearch()
-    index_documents(es_client, documents, model)
+    documents, corpus_hash = fetch_documents()
+    # Embedding workers load their own model, only load one here when encoding in-process
+    model = load_model() if EMBED_WORKERS <= 1 else None
+    cache = load_embedding_cache()
+
+    try:
+        if INGEST_MODE == "incremental":
+            es_client, _ = setup_elasticsearch(recreate=False)
+            sync_documents(es_client, documents, model, cache=cache)
+        elif INGEST_MODE == "full":
+            es_client, checkpoint = resume_or_setup_index(corpus_hash)
+            index_name = checkpoint["index_name"]
+            resume_from = checkpoint["committed_documents"]
+
+            def record_progress(committed: int) -> None:
+                checkpoint["committed_documents"] = resume_from + committed
+                if corpus_hash:
+                    save_checkpoint(checkpoint)
+
+            # Skip the documents committed before the interruption, the corpus order is the same
+            remaining = islice(prepare_documents(documents), resume_from, None)
+            with bulk_load_profile(es_client, index_name):
+                stats = index_documents(
+                    es_client, remaining, model, cache=cache, index_name=index_name, on_progress=record_progress
+                )
+
+            # Never put a partially indexed version live
+            if stats["failed"]:
+                raise RuntimeError(f"{stats['failed']} documents failed to index, '{index_name}' was not published")
+            publish_index(es_client, index_name)
+            clear_checkpoint()
+        else:
+            raise ValueError(f"Unknown ingest mode: {INGEST_MODE}")
+
+        if LOCAL_INDEX_DIR:
+            print("Exporting local search snapshot...")
+            export_snapshot(es_client, INDEX_NAME, MODEL_NAME)
+    finally:
+        if cache is not None:
+            cache.flush()
+            print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} entries")
 
 
     print("Initializing database...")
@@ -7,8 +7,11 @@ data for analysis.
 
 Functions:
     - get_db_connection: Establishes a connection to the PostgreSQL database.
-    - init_db: Initializes the database by creating necessary tables.
+    - init_db: Initializes the database by creating the missing tables and columns.
     - save_conversation: Saves a conversation entry into the 'conversations' table.
+    - update_relevance: Backfills the relevance evaluation of a saved answer.
+    - get_ungraded_conversations: Retrieves conversations whose answers still need a relevance evaluation.
+    - update_relevances: Stores the relevance evaluations of many conversations in bulk.
     - save_feedback: Saves feedback related to a conversation into the 'feedback' table.
     - get_recent_conversations: Retrieves recent conversations with optional relevance filtering.
     - get_feedback_stats: Retrieves statistics of feedback, summarizing counts of positive and negative feedback.
@@ -22,11 +25,11 @@ Ensure the environment variables for database connection are set correctly befor
 
 import os
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
 from psycopg2.extensions import connection
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 
 tz = ZoneInfo("Australia/Sydney")
 
@@ -48,10 +51,12 @@ def get_db_connection() -> connection:
     return db_connection
 
 
-def init_db() -> None:
+def init_db(reset: bool = False) -> None:
     """
     Initializes the database by creating the necessary tables.
-    Drops existing tables 'feedback' and 'conversations' if they exist.
+
+    Existing tables and their rows are kept, so it is safe to call on every ingestion run. Columns added
+    since a table was created are added to it.
 
     The function creates:
         - 'conversations' table: Stores conversation data.
@@ -59,6 +64,10 @@ def init_db() -> None:
 
     Uses a connection obtained from `get_db_connection()`.
 
+    Args:
+        reset (bool): Drop the 'feedback' and 'conversations' tables first, deleting all saved
+            conversations and feedback. Defaults to False.
+
     Returns:
         None
     """
@@ -66,12 +75,14 @@ def init_db() -> None:
     
     try:
         with conn.cursor() as cur:
-            cur.execute("DROP TABLE IF EXISTS feedback")
-            cur.execute("DROP TABLE IF EXISTS conversations")
+            if reset:
+                cur.execute("DROP TABLE IF EXISTS feedback")
+                cur.execute("DROP TABLE IF EXISTS conversations")
 
             cur.execute("""
-                CREATE TABLE conversations (
+                CREATE TABLE IF NOT EXISTS conversations (
                     id TEXT NOT NULL,
+                    answer_id TEXT,
                     question TEXT NOT NULL,
                     answer TEXT NOT NULL,
     
@@ -89,8 +100,11 @@ def init_db() -> None:
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
+            # Tables created before answers had ids lack the column
+            cur.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS answer_id TEXT")
+            cur.execute("CREATE INDEX IF NOT EXISTS conversations_answer_id_idx ON conversations (answer_id)")
             cur.execute("""
-                CREATE TABLE feedback (
+                CREATE TABLE IF NOT EXISTS feedback (
                     id SERIAL PRIMARY KEY,
                     conversation_id TEXT REFERENCES conversations(id),
                     feedback INTEGER NOT NULL,
@@ -129,6 +143,7 @@ def save_conversation(
             - eval_completion_tokens (int): The number of tokens in the evaluation completion.
             - eval_total_tokens (int): The total number of tokens in the evaluation.
             - openai_cost (float): The cost associated with the OpenAI API call.
+            - answer_id (Optional[str]): The id of the answer, used to backfill a deferred evaluation.
         timestamp (Optional[datetime]): The timestamp of the conversation. Defaults to current time.
 
     Returns:
@@ -144,13 +159,14 @@ def save_conversation(
             cur.execute(
                 """
                 INSERT INTO conversations 
-                (id, question, answer, model_used, response_time, relevance, 
+                (id, answer_id, question, answer, model_used, response_time, relevance, 
                 relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
                 eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
                 """,
                 (
                     conversation_id,
+                    answer_data.get("answer_id"),
                     question,
                     answer_data["answer"],
                     answer_data["model_used"],
@@ -172,6 +188,142 @@ def save_conversation(
         conn.close()
 
 
+def update_relevance(answer_id: str, relevance: str, explanation: str, eval_tokens: Dict[str, int]) -> bool:
+    """
+    Backfills the relevance evaluation of an answer that was saved before it was graded.
+
+    Args:
+        answer_id (str): The id of the answer.
+        relevance (str): The relevance classification of the answer.
+        explanation (str): An explanation of the relevance.
+        eval_tokens (Dict[str, int]): The 'prompt_tokens', 'completion_tokens' and 'total_tokens' of the evaluation.
+
+    Returns:
+        bool: Whether a saved answer with this id was found.
+    """
+    conn: connection = get_db_connection()
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE conversations
+                SET relevance = %s, relevance_explanation = %s, eval_prompt_tokens = %s,
+                    eval_completion_tokens = %s, eval_total_tokens = %s
+                WHERE answer_id = %s
+                """,
+                (
+                    relevance,
+                    explanation,
+                    eval_tokens["prompt_tokens"],
+                    eval_tokens["completion_tokens"],
+                    eval_tokens["total_tokens"],
+                    answer_id,
+                ),
+            )
+            updated = cur.rowcount
+        conn.commit()
+        return updated > 0
+    finally:
+        conn.close()
+
+
+def get_ungraded_conversations(
+    relevances: Sequence[str] = ("PENDING",), 
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fetches the conversations whose answers still need a relevance evaluation, oldest first.
+
+    Conversations are ordered by their timestamp and id. Passing the 'timestamp' and 'id' of the last
+    conversation of a page as `after` fetches the next page, so conversations that were graded into one of
+    `relevances` again, or that could not be graded, are not read twice.
+
+    Args:
+        relevances (Sequence[str]): The relevance values that mark an answer as ungraded. Defaults to ("PENDING",).
+        limit (Optional[int]): The maximum number of conversations to fetch. Defaults to all.
+        after (Optional[Tuple[datetime, str]]): Only fetch conversations after this timestamp and id.
+            Defaults to starting with the oldest.
+
+    Returns:
+        List[Dict[str, Any]]: The 'answer_id', 'row_id', 'id', 'timestamp', 'question' and 'answer' of every
+        ungraded conversation. Rows are matched by their 'answer_id' in `update_relevances`. Rows saved
+        without one are matched by 'row_id', which identifies the row as long as it is not changed in between.
+    """
+    conn: connection = get_db_connection()
+
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(
+                f"""
+                SELECT answer_id, ctid::text AS row_id, id, timestamp, question, answer
+                FROM conversations
+                WHERE relevance = ANY(%s) {"AND (timestamp, id) > (%s, %s)" if after else ""}
+                ORDER BY timestamp, id
+                LIMIT %s
+                """,
+                (list(relevances), *(after or ()), limit),
+            )
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def update_relevances(
+    evaluations: List[Tuple[Optional[str], str, str, str, int, int, int]], 
+    relevances: Sequence[str] = ("PENDING",)
+) -> int:
+    """
+    Stores the relevance evaluations of many conversations, in one statement per kind of row key.
+
+    Rows that were graded in the meantime, for example by the background relevance worker, are left as they are.
+
+    Args:
+        evaluations (List[Tuple[Optional[str], str, str, str, int, int, int]]): Per conversation the
+            'answer_id' and 'row_id' from `get_ungraded_conversations`, the relevance, the explanation and
+            the evaluation prompt, completion and total tokens.
+        relevances (Sequence[str]): The relevance values that mark an answer as ungraded. Defaults to ("PENDING",).
+
+    Returns:
+        int: The number of updated conversations.
+    """
+    if not evaluations:
+        return 0
+    # Answer ids stay valid however the rows change, physical row ids only address rows saved without one
+    by_answer_id = [(answer_id, *evaluation) for answer_id, _, *evaluation in evaluations if answer_id]
+    by_row_id = [(row_id, *evaluation) for answer_id, row_id, *evaluation in evaluations if not answer_id]
+
+    conn: connection = get_db_connection()
+
+    try:
+        updated = 0
+        with conn.cursor() as cur:
+            # execute_values only fills the VALUES placeholder, so the filter is bound beforehand
+            ungraded = cur.mogrify("c.relevance = ANY(%s)", (list(relevances),)).decode().replace("%", "%%")
+            for rows, match in ((by_answer_id, "c.answer_id = v.key"), (by_row_id, "c.ctid = v.key::tid")):
+                if not rows:
+                    continue
+                execute_values(
+                    cur,
+                    f"""
+                    UPDATE conversations AS c
+                    SET relevance = v.relevance, relevance_explanation = v.explanation,
+                        eval_prompt_tokens = v.prompt_tokens, eval_completion_tokens = v.completion_tokens,
+                        eval_total_tokens = v.total_tokens
+                    FROM (VALUES %s) AS v (key, relevance, explanation, prompt_tokens, completion_tokens, total_tokens)
+                    WHERE {match} AND {ungraded}
+                    """,
+                    rows,
+                    page_size=len(rows),  # One statement, so rowcount covers every row
+                )
+                updated += cur.rowcount
+        conn.commit()
+        return updated
+    finally:
+        conn.close()
+
+
 def save_feedback(conversation_id: str, feedback: int, timestamp: Optional[datetime] = None) -> None:
     """
     Saves feedback related to a conversation into the 'feedback' table.
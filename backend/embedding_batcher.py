@@ -0,0 +1,133 @@
+"""
+embedding_batcher.py
+
+This module provides a micro-batching front end for a SentenceTransformer model that is shared by
+concurrent request handlers.
+
+Instead of every request thread encoding its own query, callers submit their text to a single background
+thread. That thread waits a few milliseconds for further submissions, encodes everything that arrived
+in one model call and hands each caller its vector. Requests that arrive while a batch is being encoded
+are picked up by the next batch, so embedding throughput grows with concurrency.
+
+Classes:
+    - MicroBatchEncoder: Collects concurrent encode calls into batched model calls.
+"""
+
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future, InvalidStateError
+from sentence_transformers import SentenceTransformer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class MicroBatchEncoder:
+    """
+    Encodes texts submitted from many threads in shared batches on a single background thread.
+
+    Args:
+        model (SentenceTransformer): The model used for encoding.
+        max_batch_size (int): The maximum number of texts encoded in one model call.
+        max_wait_ms (float): Milliseconds to wait for more texts after the first one of a batch arrived.
+    """
+
+    def __init__(self, model: SentenceTransformer, max_batch_size: int = 32, max_wait_ms: float = 2.0) -> None:
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """
+        Queues a text for encoding.
+
+        Args:
+            text (str): The text to encode.
+
+        Returns:
+            Future: A future that resolves to the embedding of the text.
+        """
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        Encodes a text as part of the next batch and waits for the result.
+
+        Args:
+            text (str): The text to encode.
+
+        Returns:
+            np.ndarray: The embedding of the text.
+        """
+        return self.submit(text).result()
+
+    def _collect_batch(self) -> List[Tuple[str, Future]]:
+        batch = []
+        while not batch:
+            self._add_pending(batch, self._queue.get())
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                # Take whatever queued up while the previous batch was encoded, then wait until the deadline
+                self._add_pending(batch, self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _add_pending(batch: List[Tuple[str, Future]], item: Tuple[str, Future]) -> None:
+        # Callers that gave up cancel their future, e.g. a cancelled asyncio task waiting on it. Marking the
+        # others as running means they can no longer be cancelled before their result is set
+        if item[1].set_running_or_notify_cancel():
+            batch.append(item)
+
+    @staticmethod
+    def _resolve(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass  # Already resolved, the encoding thread must keep running for the other callers
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+            except Exception as e:
+                for _, future in batch:
+                    self._resolve(future, error=e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                self._resolve(future, vector)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarises how well concurrent calls were batched.
+
+        Returns:
+            Dict[str, Any]: The number of 'batches' and 'texts' encoded, the 'average_batch_size'
+            and the number of texts currently 'queued'.
+        """
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,225 @@
+"""
+embedding_cache.py
+
+This module provides a persistent, content-addressed cache for sentence embeddings so that re-ingesting
+an unchanged corpus does not re-encode text that has already been embedded.
+
+Entries are keyed by (model name, SHA-256 of the text). Every model gets its own directory under the
+cache root containing:
+    - meta.json: The model name and vector dimensions.
+    - keys.txt: One text hash per line, in row order.
+    - vectors.f32: A row-major float32 matrix of the embeddings, memory-mapped for reads.
+
+New entries are appended, vectors first and keys second. Keys map to vectors by line position, so on load
+both files are truncated to the rows they have in common; vectors or a partial key line left behind by an
+interrupted write are discarded before anything is appended after them.
+
+Classes:
+    - EmbeddingCache: Looks up, stores and evicts cached embeddings for one model.
+
+Functions:
+    - text_hash: Computes the content hash used as the cache key.
+
+Environment Variables:
+    - EMBEDDING_CACHE_DIR: Root directory of the cache (default 'data/embedding_cache'). Set it to an
+      empty string to disable caching.
+"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+
+# Pending entries are written to disk once this many have accumulated
+FLUSH_THRESHOLD = 4096
+
+
+def text_hash(text: str) -> str:
+    """
+    Computes the content hash used as the cache key for a piece of text.
+
+    Args:
+        text (str): The text that is embedded.
+
+    Returns:
+        str: The hex encoded SHA-256 digest of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _model_directory_name(model_name: str) -> str:
+    # Model names may contain slashes or be local paths, keep the name readable and make it unique
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+    return f"{slug}-{hashlib.sha256(model_name.encode('utf-8')).hexdigest()[:8]}"
+
+
+class EmbeddingCache:
+    """
+    An on-disk embedding cache for a single model.
+
+    Lookups read from a memory-mapped vector file, so only the rows that are actually hit are paged in.
+    Stores are buffered in memory and appended to disk by `flush`.
+
+    Args:
+        model_name (str): The name of the SentenceTransformer model the embeddings belong to.
+        cache_dir (str): The root directory of the cache. Defaults to EMBEDDING_CACHE_DIR.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR) -> None:
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.directory = os.path.join(cache_dir, _model_directory_name(model_name))
+        self.hits = 0
+        self.misses = 0
+
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._keys_path = os.path.join(self.directory, "keys.txt")
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+
+        self._dims: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._pending: Dict[str, np.ndarray] = {}
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self._meta_path):
+            return
+
+        with open(self._meta_path) as f:
+            self._dims = json.load(f)["dims"]
+
+        keys = []
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path) as f:
+                keys = [line[:-1] for line in f if line.endswith("\n")]
+
+        # Drop keys without a complete vector and vectors without a key, e.g. after an interrupted flush,
+        # so the next flush appends at the row its keys are numbered from
+        row_bytes = self._dims * np.dtype(np.float32).itemsize
+        vector_bytes = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        stored_rows = min(len(keys), vector_bytes // row_bytes)
+        keys = keys[:stored_rows]
+        if vector_bytes != stored_rows * row_bytes:
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(stored_rows * row_bytes)
+        key_bytes = os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+        if key_bytes != sum(len(key) + 1 for key in keys):
+            with open(self._keys_path, "w") as f:
+                f.write("".join(f"{key}\n" for key in keys))
+
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._vectors = (
+            np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(stored_rows, self._dims))
+            if stored_rows else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._pending)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up the cached embeddings for a list of texts.
+
+        Args:
+            texts (Sequence[str]): The texts to look up.
+
+        Returns:
+            List[Optional[np.ndarray]]: The cached vector for every text, or None where the text is not cached.
+        """
+        results: List[Optional[np.ndarray]] = []
+        for text in texts:
+            key = text_hash(text)
+            vector = self._pending.get(key)
+            if vector is None and key in self._rows:
+                vector = self._vectors[self._rows[key]]
+
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            results.append(vector)
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Stores embeddings for a list of texts. Entries are written to disk by `flush`, which is
+        also called automatically once FLUSH_THRESHOLD entries are pending.
+
+        Args:
+            texts (Sequence[str]): The embedded texts.
+            vectors (np.ndarray): The embeddings, one row per text.
+        """
+        for text, vector in zip(texts, vectors):
+            key = text_hash(text)
+            if key not in self._rows:
+                self._pending[key] = np.asarray(vector, dtype=np.float32)
+
+        if len(self._pending) >= FLUSH_THRESHOLD:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Appends all pending entries to the on-disk store and re-maps the vector file. Only the new entries
+        are indexed, the existing keys are not read again.
+        """
+        if not self._pending:
+            return
+
+        keys = list(self._pending)
+        vectors = np.stack([self._pending[key] for key in keys]).astype(np.float32)
+
+        if self._dims is None:
+            self._dims = vectors.shape[1]
+            with open(self._meta_path, "w") as f:
+                json.dump({"model_name": self.model_name, "dims": self._dims}, f)
+
+        # Release the current mapping before growing the file underneath it
+        self._vectors = None
+        try:
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, "a") as f:
+                f.write("".join(f"{key}\n" for key in keys))
+        except BaseException:
+            self._load()  # Drop whatever part of the entries was written, they stay pending
+            raise
+
+        # Both files held the same rows before, so the new entries are numbered on from the known ones
+        start = len(self._rows)
+        self._rows.update((key, start + offset) for offset, key in enumerate(keys))
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self._rows), self._dims))
+        self._pending = {}
+
+    def evict_stale_models(self) -> List[str]:
+        """
+        Removes cached embeddings of every other model from the cache root, e.g. after MODEL_NAME changed.
+
+        Returns:
+            List[str]: The names of the evicted models.
+        """
+        evicted = []
+        for entry in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, entry)
+            if path == self.directory or not os.path.isdir(path):
+                continue
+
+            meta_path = os.path.join(path, "meta.json")
+            model_name = entry
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    model_name = json.load(f).get("model_name", entry)
+
+            shutil.rmtree(path)
+            evicted.append(model_name)
+        return evicted
@@ -0,0 +1,156 @@
+"""
+knn_sweep.py
+
+This script measures the latency / recall trade-off of the k-NN search for different `num_candidates` settings,
+so the cheapest setting that keeps retrieval quality can be chosen for KNN_NUM_CANDIDATES.
+
+For every query the exact nearest neighbours are computed once with a brute-force `script_score` query. Every
+`num_candidates` setting is then timed over the same queries, and recall@k is the share of the exact top k
+documents the approximate search returned.
+
+Queries are read from a JSON or JSON Lines file of objects with a 'question' field, or sampled at random from
+the questions stored in the index.
+
+Usage:
+    python knn_sweep.py --num-candidates 10 50 100 500 1000 10000 --k 5 --sample 200
+
+Dependencies:
+    - chat_functions (for the Elasticsearch client, query embeddings and k-NN search)
+    - corpus (for reading the query file)
+"""
+
+import time
+import json
+import argparse
+import numpy as np
+from typing import Any, Dict, List
+
+from chat_functions import INDEX_NAME, SEARCH_K, es_client, embed_query, elastic_search_knn
+from corpus import stream_documents
+
+
+def sample_queries(sample_size: int, seed: int = 42) -> List[str]:
+    """
+    Samples questions stored in the index to use as queries.
+
+    Args:
+        sample_size (int): The number of questions to sample.
+        seed (int): The random seed, so repeated sweeps use the same queries. Defaults to 42.
+
+    Returns:
+        List[str]: The sampled questions.
+    """
+    response = es_client.search(
+        index=INDEX_NAME,
+        size=sample_size,
+        query={"function_score": {"random_score": {"seed": seed, "field": "_seq_no"}}},
+        source=["question"],
+    )
+    return [hit["_source"]["question"] for hit in response["hits"]["hits"]]
+
+
+def exact_neighbours(field: str, vector: np.ndarray, k: int) -> List[Any]:
+    """
+    Finds the exact k nearest neighbours of a vector by scoring every document.
+
+    Args:
+        field (str): The vector field to search.
+        vector (np.ndarray): The query vector.
+        k (int): The number of neighbours.
+
+    Returns:
+        List[Any]: The ids of the nearest documents, closest first.
+    """
+    response = es_client.search(
+        index=INDEX_NAME,
+        size=k,
+        query={
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {
+                    "source": f"cosineSimilarity(params.query_vector, '{field}') + 1.0",
+                    "params": {"query_vector": vector},
+                },
+            }
+        },
+        source=["id"],
+    )
+    return [hit["_source"]["id"] for hit in response["hits"]["hits"]]
+
+
+def sweep(queries: List[str], field: str, k: int, candidate_settings: List[int]) -> List[Dict[str, float]]:
+    """
+    Measures latency and recall@k of the k-NN search for every `num_candidates` setting.
+
+    Args:
+        queries (List[str]): The query strings.
+        field (str): The vector field to search.
+        k (int): The number of results per query.
+        candidate_settings (List[int]): The `num_candidates` values to measure.
+
+    Returns:
+        List[Dict[str, float]]: Per setting, the 'num_candidates', the 'p50_ms' and 'p95_ms' client-side
+        latency and the mean 'recall'.
+    """
+    vectors = [embed_query(query) for query in queries]
+    truths = [set(exact_neighbours(field, vector, k)) for vector in vectors]
+
+    results = []
+    for num_candidates in candidate_settings:
+        # Warm up caches so the first setting is not penalised
+        elastic_search_knn(field, vectors[0], k=k, num_candidates=num_candidates)
+
+        latencies, recalls = [], []
+        for vector, truth in zip(vectors, truths):
+            start = time.perf_counter()
+            hits = elastic_search_knn(field, vector, k=k, num_candidates=num_candidates)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(truth & {hit["id"] for hit in hits}) / max(1, len(truth)))
+
+        results.append({
+            "num_candidates": num_candidates,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "recall": float(np.mean(recalls)),
+        })
+    return results
+
+
+def main() -> None:
+    """
+    Parses the command line, runs the sweep and prints one line per `num_candidates` setting.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description="Measure k-NN latency against recall@k for num_candidates settings.")
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[10, 50, 100, 500, 1000, 10000])
+    parser.add_argument("--k", type=int, default=SEARCH_K)
+    parser.add_argument("--field", default="question_vector", choices=["question_vector", "question_answer_vector"])
+    parser.add_argument("--queries", help="JSON or JSON Lines file of objects with a 'question' field")
+    parser.add_argument("--sample", type=int, default=200, help="Number of indexed questions to sample without --queries")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.queries:
+        queries = [doc["question"] for doc in stream_documents(args.queries)]
+    else:
+        queries = sample_queries(args.sample)
+    print(f"Sweeping {len(queries)} queries on '{args.field}' with k={args.k}")
+
+    results = sweep(queries, args.field, args.k, sorted(args.num_candidates))
+
+    print(f"{'num_candidates':>15} {'p50 ms':>9} {'p95 ms':>9} {'recall@' + str(args.k):>10}")
+    for result in results:
+        print(
+            f"{result['num_candidates']:>15} {result['p50_ms']:>9.1f} "
+            f"{result['p95_ms']:>9.1f} {result['recall']:>10.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+llm_clients.py
+
+This module provides the OpenAI and Ollama clients, the `llm` call shared by the backend and offline jobs,
+and the HTTP connection pools behind the clients, so concurrent LLM calls reuse warm keep-alive connections
+instead of paying the TCP and TLS handshakes again, and do not queue behind a pool that is too small for
+the load. It has no heavy dependencies, so scripts that only call a language model can import it without
+loading the embedding model and background workers of chat_functions.py.
+
+Every provider gets one shared synchronous and one shared asynchronous httpx client, built from its own
+settings. The clients trace the connections they open, so the share of requests that reused a pooled
+connection can be reported.
+
+Classes:
+    - ConnectionStats: Counts the requests of a client and the connections opened for them.
+
+Functions:
+    - pool_settings: Reads the connection pool settings of a provider.
+    - get_http_client: Returns the shared synchronous httpx client of a provider.
+    - get_async_http_client: Returns the shared asynchronous httpx client of a provider.
+    - get_connection_stats: Reports the connection reuse of every client.
+    - llm: Sends a prompt to a language model and retrieves the response, token usage, and response time.
+
+Environment variables:
+    - OLLAMA_URL: The OpenAI compatible endpoint of Ollama (default 'http://ollama:11434/v1/').
+    - OPENAI_API_KEY: The OpenAI API key.
+
+Connection pool environment variables, one set per provider with the prefix OPENAI_HTTP or OLLAMA_HTTP. The defaults are
+the connection limits and timeouts of the openai package, with idle connections kept open longer:
+    - <PREFIX>_MAX_CONNECTIONS: The maximum number of open connections (default 1000).
+    - <PREFIX>_MAX_KEEPALIVE: The maximum number of idle connections kept open (default 100).
+    - <PREFIX>_KEEPALIVE_EXPIRY: Seconds an idle connection is kept open (default 60).
+    - <PREFIX>_CONNECT_TIMEOUT: Seconds to wait for a connection to be established (default 5).
+    - <PREFIX>_TIMEOUT: Seconds to wait for reading or writing a response (default 600).
+    - <PREFIX>_POOL_TIMEOUT: Seconds to wait for a free connection of the pool (default <PREFIX>_TIMEOUT).
+    - <PREFIX>_HTTP2: 'true' to use HTTP/2 when the optional h2 package is installed (default 'false').
+"""
+
+import os
+import time
+import threading
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI
+from typing import Any, Dict, Tuple
+
+try:
+    import h2
+except ImportError:  # HTTP/2 is optional, httpx needs the h2 package for it
+    h2 = None
+
+
+load_dotenv()
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434/v1/")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+
+class ConnectionStats:
+    """
+    Counts the requests of a client and the connections it opened for them.
+
+    `trace` and `atrace` are httpcore trace callbacks, see the 'trace' request extension of httpx.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def count_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def trace(self, event: str, info: Dict[str, Any]) -> None:
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    async def atrace(self, event: str, info: Dict[str, Any]) -> None:
+        self.trace(event, info)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarises the connection reuse since the client was created.
+
+        Returns:
+            Dict[str, Any]: The number of 'requests', of 'connections' opened and of 'tls_handshakes', and
+            the 'reuse_rate', the share of requests sent over a connection that was already open.
+        """
+        with self._lock:
+            reused = max(0, self.requests - self.connections)
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+            }
+
+
+_clients: Dict[Tuple[str, bool], httpx.Client] = {}
+_client_stats: Dict[Tuple[str, bool], ConnectionStats] = {}
+_clients_lock = threading.Lock()
+
+
+def pool_settings(provider: str) -> Dict[str, Any]:
+    """
+    Reads the connection pool settings of a provider from the environment.
+
+    Args:
+        provider (str): The provider name, 'openai' or 'ollama'.
+
+    Returns:
+        Dict[str, Any]: The httpx 'limits' and 'timeout' and whether to use 'http2'.
+    """
+    prefix = f"{provider.upper()}_HTTP"
+    http2 = os.getenv(f"{prefix}_HTTP2", "false").lower() == "true"
+    if http2 and h2 is None:
+        print(f"{prefix}_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+        http2 = False
+
+    timeout = float(os.getenv(f"{prefix}_TIMEOUT", "600"))
+    return {
+        "limits": httpx.Limits(
+            max_connections=int(os.getenv(f"{prefix}_MAX_CONNECTIONS", "1000")),
+            max_keepalive_connections=int(os.getenv(f"{prefix}_MAX_KEEPALIVE", "100")),
+            keepalive_expiry=float(os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", "60")),
+        ),
+        "timeout": httpx.Timeout(
+            timeout,
+            connect=float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", "5")),
+            pool=float(os.getenv(f"{prefix}_POOL_TIMEOUT", str(timeout))),
+        ),
+        "http2": http2,
+    }
+
+
+def _get_client(provider: str, asynchronous: bool):
+    key = (provider, asynchronous)
+    with _clients_lock:
+        if key not in _clients:
+            stats = ConnectionStats()
+            trace = stats.atrace if asynchronous else stats.trace
+
+            def add_trace(request: httpx.Request) -> None:
+                stats.count_request(request)
+                request.extensions.setdefault("trace", trace)
+
+            if asynchronous:
+                async def hook(request: httpx.Request) -> None:
+                    add_trace(request)
+
+                client_class = httpx.AsyncClient
+            else:
+                hook = add_trace
+                client_class = httpx.Client
+
+            _clients[key] = client_class(event_hooks={"request": [hook]}, **pool_settings(provider))
+            _client_stats[key] = stats
+        return _clients[key]
+
+
+def get_http_client(provider: str) -> httpx.Client:
+    """
+    Returns the shared synchronous httpx client of a provider, creating it on first use.
+
+    Args:
+        provider (str): The provider name, 'openai' or 'ollama'.
+
+    Returns:
+        httpx.Client: The client, to be passed as `http_client` to `openai.OpenAI`.
+    """
+    return _get_client(provider, False)
+
+
+def get_async_http_client(provider: str) -> httpx.AsyncClient:
+    """
+    Returns the shared asynchronous httpx client of a provider, creating it on first use.
+
+    Args:
+        provider (str): The provider name, 'openai' or 'ollama'.
+
+    Returns:
+        httpx.AsyncClient: The client, to be passed as `http_client` to `openai.AsyncOpenAI`.
+    """
+    return _get_client(provider, True)
+
+
+def get_connection_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Reports the connection reuse of every client created so far.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The statistics by provider name, with an '_async' suffix for the
+        asynchronous clients, see `ConnectionStats.stats`.
+    """
+    with _clients_lock:
+        items = list(_client_stats.items())
+    return {
+        f"{provider}_async" if asynchronous else provider: stats.stats()
+        for (provider, asynchronous), stats in items
+    }
+
+
+# The LLM clients share the tuned connection pools above
+ollama_client = OpenAI(base_url=OLLAMA_URL, api_key="ollama", http_client=get_http_client("ollama"))
+openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=get_http_client("openai"))
+
+
+def llm(prompt: str, model_choice: str) -> Tuple[str, Dict[str, int], float]:
+    """
+    Sends a prompt to a specified language model and retrieves the response, token usage, and response time.
+
+    Supports models from 'ollama/' and 'openai/' prefixes. Raises a ValueError for unknown model choices.
+
+    Args:
+        prompt (str): The input prompt to send to the language model.
+        model_choice (str): The identifier for the model to use. Should start with 'ollama/' or 'openai/'.
+
+    Returns:
+        Tuple[str, Dict[str, int], float]: A tuple containing:
+            - The response content from the model (str).
+            - A dictionary with token usage metrics:
+                - 'prompt_tokens' (int): Number of tokens in the prompt.
+                - 'completion_tokens' (int): Number of tokens in the completion.
+                - 'total_tokens' (int): Total number of tokens used.
+            - The response time in seconds (float).
+    """
+    start_time = time.time()
+    
+    if model_choice.startswith('ollama/'):
+        response = ollama_client.chat.completions.create(
+            model=model_choice.split('/')[-1],
+            messages=[{"role": "user", "content": prompt}]
+        )
+    elif model_choice.startswith('openai/'):
+        response = openai_client.chat.completions.create(
+            model=model_choice.split('/')[-1],
+            messages=[{"role": "user", "content": prompt}]
+        )
+        
+    elif model_choice.startswith('aws_bedrock/'):
+        response = openai_client.chat.completions.create(
+            model=model_choice.split('/')[-1],
+            messages=[{"role": "user", "content": prompt}]
+        )
+    else:
+        raise ValueError(f"Unknown model choice: {model_choice}")
+    
+    answer = response.choices[0].message.content
+    tokens = {
+        'prompt_tokens': response.usage.prompt_tokens,
+        'completion_tokens': response.usage.completion_tokens,
+        'total_tokens': response.usage.total_tokens
+    }
+    
+    end_time = time.time()
+    response_time = end_time - start_time
+    
+    return answer, tokens, response_time
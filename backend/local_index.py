@@ -0,0 +1,298 @@
+"""
+local_index.py
+
+This module provides an in-process vector search engine over a snapshot of the Elasticsearch index, so vector
+search can be answered without a network round trip.
+
+Ingestion exports every snapshot into a directory of its own, '<LOCAL_INDEX_DIR>.<milliseconds>', and then
+points the symlink LOCAL_INDEX_DIR at it, so readers never see a missing or partly replaced snapshot. A
+snapshot directory contains:
+    - meta.json: The model name, document count, vector dimensions and dtype, the exported index version
+      and the creation time.
+    - <field>.npy: One L2-normalised float32 or float16 matrix per vector field, memory-mapped when loaded.
+    - <field>.hnsw: An optional HNSW graph per vector field, built when hnswlib is installed.
+    - docs.jsonl / offsets.npy: The 'id', 'question' and 'answer' of every row, read on demand.
+    - bm25_*: The inverted index of the 'question' and 'answer' fields, see local_text_index.py.
+
+Searches score every row with one vectorised matrix product and select the top k with argpartition, or walk
+the HNSW graph when one was built. Because the vectors are normalised the dot product is the cosine
+similarity, and results are scored like an Elasticsearch 'cosine' dense_vector field: (1 + cosine) / 2.
+
+Classes:
+    - LocalVectorIndex: Loads a snapshot and answers k-NN queries.
+
+Functions:
+    - export_snapshot: Writes a snapshot of an Elasticsearch index.
+
+Environment Variables:
+    - LOCAL_INDEX_DIR: Directory of the snapshot (default 'data/local_index'). Set it to an empty string to
+      skip exporting snapshots during ingestion.
+    - LOCAL_INDEX_DTYPE: 'float32' (default) or 'float16' storage for the vectors.
+    - LOCAL_INDEX_HNSW: 'true' to build HNSW graphs when hnswlib is installed (default 'false').
+"""
+
+import os
+import re
+import json
+import mmap
+import time
+import shutil
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+from typing import Any, Dict, List, Optional, Tuple
+
+from local_text_index import BM25Builder, LocalBM25Index
+
+try:
+    import hnswlib
+except ImportError:  # HNSW graphs are optional, exact search needs only NumPy
+    hnswlib = None
+
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "data/local_index")
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+LOCAL_INDEX_HNSW = os.getenv("LOCAL_INDEX_HNSW", "false").lower() == "true"
+
+VECTOR_FIELDS = ["question_vector", "question_answer_vector"]
+
+# float16 rows are scored in blocks of this many rows, NumPy has no fast float16 matrix product
+_SCORE_BLOCK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _remove_old_snapshots(directory: str, keep: set) -> None:
+    parent = os.path.dirname(os.path.abspath(directory))
+    pattern = re.compile(rf"^{re.escape(os.path.basename(os.path.abspath(directory)))}\.(\d+|old)$")
+    for name in os.listdir(parent):
+        path = os.path.realpath(os.path.join(parent, name))
+        if pattern.match(name) and path not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def export_snapshot(
+    es_client: Elasticsearch,
+    index_name: str,
+    model_name: str,
+    directory: str = LOCAL_INDEX_DIR,
+    dtype: str = LOCAL_INDEX_DTYPE,
+    build_hnsw: bool = LOCAL_INDEX_HNSW
+) -> Dict[str, Any]:
+    """
+    Exports the documents and vectors of an Elasticsearch index into a local snapshot.
+
+    The snapshot is written into a new directory next to `directory`, and `directory` is atomically
+    replaced by a symlink to it once it is complete, so a serving process never loads a half written
+    snapshot. The snapshot it replaced is kept for processes that are still loading it, older ones are
+    removed. A plain `directory` written by earlier versions is replaced by the symlink.
+
+    Args:
+        es_client (Elasticsearch): The Elasticsearch client instance.
+        index_name (str): The index or alias to export.
+        model_name (str): The name of the model the vectors were created with.
+        directory (str): The snapshot directory. Defaults to LOCAL_INDEX_DIR.
+        dtype (str): The storage dtype of the vectors, 'float32' or 'float16'. Defaults to LOCAL_INDEX_DTYPE.
+        build_hnsw (bool): Whether to build HNSW graphs, requires hnswlib. Defaults to LOCAL_INDEX_HNSW.
+
+    Returns:
+        Dict[str, Any]: The metadata of the written snapshot.
+    """
+    start = time.perf_counter()
+    es_client.indices.refresh(index=index_name)
+    count = es_client.count(index=index_name)["count"]
+    version = next(iter(es_client.indices.get(index=index_name).body))
+
+    created_at = time.time()
+    snapshot_directory = f"{directory}.{int(created_at * 1000)}"
+    shutil.rmtree(snapshot_directory, ignore_errors=True)
+    os.makedirs(snapshot_directory)
+
+    matrices: Dict[str, np.ndarray] = {}
+    text_index = BM25Builder()
+    offsets = np.zeros(count + 1, dtype=np.int64)
+
+    rows = 0
+    with open(os.path.join(snapshot_directory, "docs.jsonl"), "wb") as docs_file:
+        hits = helpers.scan(es_client, index=index_name, size=1000)
+        for hit in hits:
+            if rows == count:
+                break  # Documents added after counting are picked up by the next export
+            source = hit["_source"]
+
+            for field in VECTOR_FIELDS:
+                vector = np.asarray(source[field], dtype=np.float32)
+                if field not in matrices:
+                    matrices[field] = np.lib.format.open_memmap(
+                        os.path.join(snapshot_directory, f"{field}.npy"), mode="w+", dtype=dtype, shape=(count, len(vector))
+                    )
+                matrices[field][rows] = _normalize(vector)
+
+            text_index.add(source)
+            line = json.dumps({"id": source["id"], "question": source["question"], "answer": source["answer"]})
+            docs_file.write(line.encode("utf-8") + b"\n")
+            offsets[rows + 1] = docs_file.tell()
+            rows += 1
+
+    for field in VECTOR_FIELDS:
+        if field not in matrices:  # Nothing was exported
+            matrices[field] = np.lib.format.open_memmap(
+                os.path.join(snapshot_directory, f"{field}.npy"), mode="w+", dtype=dtype, shape=(0, 0)
+            )
+
+    dims = matrices[VECTOR_FIELDS[0]].shape[1]
+    for field, matrix in matrices.items():
+        matrix.flush()
+        if build_hnsw and hnswlib is not None and rows:
+            graph = hnswlib.Index(space="ip", dim=dims)
+            graph.init_index(max_elements=rows, ef_construction=200, M=16)
+            graph.add_items(np.asarray(matrix[:rows], dtype=np.float32), np.arange(rows))
+            graph.save_index(os.path.join(snapshot_directory, f"{field}.hnsw"))
+    np.save(os.path.join(snapshot_directory, "offsets.npy"), offsets[:rows + 1])
+    text_index.save(snapshot_directory)
+
+    meta = {
+        "model_name": model_name,
+        "index_version": version,
+        "count": rows,
+        "dims": dims,
+        "dtype": dtype,
+        "hnsw": bool(build_hnsw and hnswlib is not None and rows),
+        "created_at": created_at,
+    }
+    with open(os.path.join(snapshot_directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # Switch the symlink over in one rename, processes that still map the old files keep reading them
+    previous = os.path.realpath(directory) if os.path.islink(directory) else None
+    if os.path.isdir(directory) and previous is None:
+        os.rename(directory, f"{directory}.old")  # A snapshot exported before snapshots were versioned
+    link = f"{directory}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(snapshot_directory), link)
+    os.replace(link, directory)
+    _remove_old_snapshots(directory, keep={os.path.realpath(snapshot_directory), previous})
+
+    print(f"Exported {rows} documents from '{version}' to {directory} in {time.perf_counter() - start:.1f}s")
+    return meta
+
+
+class LocalVectorIndex:
+    """
+    An in-process k-NN index over a snapshot written by `export_snapshot`.
+
+    The vector matrices and document store are memory-mapped, so loading is cheap and only touched
+    pages are read from disk. The BM25 text index of the same rows is available as `text_index`.
+
+    Args:
+        directory (str): The snapshot directory. Defaults to LOCAL_INDEX_DIR.
+    """
+
+    def __init__(self, directory: str = LOCAL_INDEX_DIR) -> None:
+        self.directory = directory
+        # Resolve the symlink once, so every file is read from the same snapshot even if a new one is published
+        directory = os.path.realpath(directory)
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta: Dict[str, Any] = json.load(f)
+
+        # Rows beyond the count are left over from documents deleted during the export
+        self.vectors = {
+            field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")[:self.meta["count"]]
+            for field in VECTOR_FIELDS
+        }
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+
+        with open(os.path.join(directory, "docs.jsonl"), "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.meta["count"] else b""
+
+        self.graphs = {}
+        if self.meta.get("hnsw") and hnswlib is not None:
+            for field in VECTOR_FIELDS:
+                graph = hnswlib.Index(space="ip", dim=self.meta["dims"])
+                graph.load_index(os.path.join(directory, f"{field}.hnsw"), max_elements=self.meta["count"])
+                self.graphs[field] = graph
+
+        self.text_index = LocalBM25Index(directory)
+
+    @property
+    def version(self) -> Tuple[str, float]:
+        """
+        Identifies the loaded snapshot by the exported index version and the export time.
+        """
+        return self.meta["index_version"], self.meta["created_at"]
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def document(self, row: int) -> Dict[str, Any]:
+        """
+        Reads the document stored in a row of the snapshot.
+
+        Args:
+            row (int): The row number.
+
+        Returns:
+            Dict[str, Any]: The document with 'id', 'question' and 'answer'.
+        """
+        return json.loads(self._docs[self.offsets[row]:self.offsets[row + 1]])
+
+    def _exact_scores(self, field: str, vector: np.ndarray) -> np.ndarray:
+        matrix = self.vectors[field]
+        if matrix.dtype == np.float32:
+            return matrix @ vector
+
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), _SCORE_BLOCK_ROWS):
+            block = matrix[start:start + _SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ vector
+        return scores
+
+    def search_rows(self, field: str, vector: Any, k: int, ef: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the rows nearest to a query vector.
+
+        Args:
+            field (str): The vector field to search.
+            vector (Any): The query vector.
+            k (int): The number of rows to return.
+            ef (Optional[int]): The HNSW search breadth, ignored for exact search. Defaults to None.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The row numbers and their Elasticsearch style cosine scores,
+            best first.
+        """
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+
+        graph = self.graphs.get(field)
+        if graph is not None:
+            graph.set_ef(max(ef or 0, k))
+            labels, distances = graph.knn_query(query, k=k)
+            # The 'ip' space returns 1 - dot product as the distance
+            return labels[0].astype(np.int64), (2 - distances[0]) / 2
+
+        scores = self._exact_scores(field, query)
+        rows = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        rows = rows[np.argsort(-scores[rows])]
+        return rows, (1 + scores[rows]) / 2
+
+    def search(self, field: str, vector: Any, k: int, ef: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Finds the documents nearest to a query vector, like `elastic_search_knn`.
+
+        Args:
+            field (str): The vector field to search.
+            vector (Any): The query vector.
+            k (int): The number of documents to return.
+            ef (Optional[int]): The HNSW search breadth, ignored for exact search. Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: The nearest documents with 'id', 'question' and 'answer', best first.
+        """
+        rows, _ = self.search_rows(field, vector, k, ef)
+        return [self.document(row) for row in rows]
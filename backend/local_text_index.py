@@ -0,0 +1,205 @@
+"""
+local_text_index.py
+
+This module provides an in-process BM25 text retriever that mirrors the `multi_match` query of
+`elastic_search_text`, so Text and Hybrid search can run without Elasticsearch.
+
+The index is built during ingestion from the 'question' and 'answer' fields of the same snapshot as
+local_index.py, so its row numbers match the rows of the vector index. For every field it stores a compact
+inverted index in CSR form, memory-mapped when loaded:
+    - bm25_vocab.json: The terms, their position is the term id.
+    - bm25_<field>_offsets.npy: Start of every term's postings (int64, one more entry than terms).
+    - bm25_<field>_rows.npy / bm25_<field>_tfs.npy: Row number (int32) and term frequency (uint16) per posting.
+    - bm25_<field>_lengths.npy: Number of terms per row (uint32).
+
+Scoring follows Lucene's BM25 similarity (k1=1.2, b=0.75) with the standard analyzer approximated by
+lower-cased Unicode word tokens. As in a 'best_fields' multi_match, each row scores the best of its boosted
+field scores, with the question boosted 3x.
+
+Classes:
+    - BM25Builder: Accumulates documents and writes the inverted index.
+    - LocalBM25Index: Loads the inverted index and scores queries with NumPy.
+
+Functions:
+    - tokenize: Splits text into index terms.
+"""
+
+import os
+import re
+import json
+import numpy as np
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+
+TEXT_FIELDS = {"question": 3.0, "answer": 1.0}  # Field boosts, as in "question^3"
+K1 = 1.2
+B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower-cased word tokens, approximating Elasticsearch's standard analyzer.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The tokens in order, including repeats.
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Builder:
+    """
+    Accumulates the term frequencies of documents, row by row, and writes the inverted index.
+
+    Postings are appended to flat typed arrays in document order, about 10 bytes each, and only grouped by
+    term when the index is saved.
+    """
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self._term_ids: Dict[str, int] = {}
+        self._postings = {
+            field: {"terms": array("i"), "rows": array("i"), "tfs": array("H")} for field in TEXT_FIELDS
+        }
+        self._lengths = {field: array("I") for field in TEXT_FIELDS}
+
+    def add(self, document: Dict[str, Any]) -> None:
+        """
+        Adds the next row of the snapshot.
+
+        Args:
+            document (Dict[str, Any]): The document, containing 'question' and 'answer'.
+        """
+        for field in TEXT_FIELDS:
+            tokens = tokenize(document[field])
+            self._lengths[field].append(len(tokens))
+            postings = self._postings[field]
+            for term, tf in Counter(tokens).items():
+                postings["terms"].append(self._term_ids.setdefault(term, len(self._term_ids)))
+                postings["rows"].append(self.rows)
+                postings["tfs"].append(min(tf, np.iinfo(np.uint16).max))
+        self.rows += 1
+
+    def save(self, directory: str) -> None:
+        """
+        Writes the inverted index into a snapshot directory.
+
+        Args:
+            directory (str): The snapshot directory.
+        """
+        terms = list(self._term_ids)
+        with open(os.path.join(directory, "bm25_vocab.json"), "w") as f:
+            json.dump(terms, f)
+
+        for field in TEXT_FIELDS:
+            postings = self._postings[field]
+            term_ids = np.frombuffer(postings["terms"], dtype=np.int32)
+            counts = np.bincount(term_ids, minlength=len(terms)).astype(np.int64)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+            # A stable sort groups the postings by term and keeps each term's rows in ascending order
+            order = np.argsort(term_ids, kind="stable")
+            rows = np.frombuffer(postings["rows"], dtype=np.int32)[order]
+            tfs = np.frombuffer(postings["tfs"], dtype=np.uint16)[order]
+            del order
+
+            np.save(os.path.join(directory, f"bm25_{field}_offsets.npy"), offsets)
+            np.save(os.path.join(directory, f"bm25_{field}_rows.npy"), rows)
+            np.save(os.path.join(directory, f"bm25_{field}_tfs.npy"), tfs)
+            np.save(os.path.join(directory, f"bm25_{field}_lengths.npy"), np.frombuffer(self._lengths[field], dtype=np.uint32))
+
+
+class LocalBM25Index:
+    """
+    An in-process BM25 retriever over the inverted index written by `BM25Builder`.
+
+    Args:
+        directory (str): The snapshot directory.
+    """
+
+    def __init__(self, directory: str) -> None:
+        with open(os.path.join(directory, "bm25_vocab.json")) as f:
+            self.term_ids = {term: term_id for term_id, term in enumerate(json.load(f))}
+
+        self.fields = {}
+        for field in TEXT_FIELDS:
+            lengths = np.load(os.path.join(directory, f"bm25_{field}_lengths.npy"))
+            self.fields[field] = {
+                "offsets": np.load(os.path.join(directory, f"bm25_{field}_offsets.npy"), mmap_mode="r"),
+                "rows": np.load(os.path.join(directory, f"bm25_{field}_rows.npy"), mmap_mode="r"),
+                "tfs": np.load(os.path.join(directory, f"bm25_{field}_tfs.npy"), mmap_mode="r"),
+                # Precompute the length normalisation part of the BM25 denominator per row
+                "norms": (K1 * (1 - B + B * lengths / max(lengths.mean(), 1e-9))).astype(np.float32)
+                if len(lengths) else lengths.astype(np.float32),
+            }
+        self.rows = len(lengths)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _field_scores(self, field: str, term_ids: List[int]) -> np.ndarray:
+        index = self.fields[field]
+        scores = np.zeros(self.rows, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = index["offsets"][term_id], index["offsets"][term_id + 1]
+            if start == end:
+                continue
+            rows = index["rows"][start:end]
+            tfs = index["tfs"][start:end].astype(np.float32)
+            idf = np.log(1 + (self.rows - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[rows] += idf * tfs / (tfs + index["norms"][rows])
+        return scores
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Scores every row against a query like a 'best_fields' multi_match over "question^3" and "answer".
+
+        Args:
+            query (str): The query string.
+
+        Returns:
+            np.ndarray: The score of every row, zero for rows that match no query term.
+        """
+        term_ids = [self.term_ids[token] for token in tokenize(query) if token in self.term_ids]
+        scores = np.zeros(self.rows, dtype=np.float32)
+        for field, boost in TEXT_FIELDS.items():
+            np.maximum(scores, boost * self._field_scores(field, term_ids), out=scores)
+        return scores
+
+    def search_rows(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the best matching rows for a query.
+
+        Args:
+            query (str): The query string.
+            k (int): The maximum number of rows to return.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The matching row numbers and their scores, best first.
+        """
+        scores = self.score(query)
+        return top_k(scores, k)
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Selects the k highest positive scores without sorting the whole array.
+
+    Args:
+        scores (np.ndarray): One score per row.
+        k (int): The maximum number of rows to return.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The row numbers and their scores, best first.
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    rows = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return rows, scores[rows]
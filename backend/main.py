@@ -1,9 +1,15 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import json
+import asyncio
+from fastapi import BackgroundTasks, FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional
 import uvicorn
 
 # Import your assistant, database functions here
-from chat_functions import get_answer
+from chat_functions import get_cache_stats
+from llm_clients import get_connection_stats
+from async_chat_functions import get_answer, stream_answer, close_clients
 from database import save_conversation, save_feedback, get_recent_conversations, get_feedback_stats
 
 
@@ -14,6 +20,17 @@ class QueryRequest(BaseModel):
     user_input: str
     model_choice: str
     search_type: str
+    # Elasticsearch rejects k-NN searches with more than 10000 candidates
+    k: Optional[int] = Field(None, ge=1, le=10000)
+    num_candidates: Optional[int] = Field(None, ge=1, le=10000)
+    defer_evaluation: Optional[bool] = None
+    rewrite: Optional[bool] = None
+
+class StreamQueryRequest(QueryRequest):
+    conversation_id: Optional[str] = None
+
+class AskRequest(QueryRequest):
+    conversation_id: str
 
 class FeedbackRequest(BaseModel):
     conversation_id: str
@@ -32,18 +49,61 @@ class AnswerData(BaseModel):
     eval_completion_tokens: int
     eval_total_tokens: int
     openai_cost: float
+    answer_id: Optional[str] = None
 
 class ConversationRequest(BaseModel):
     conversation_id: str
     user_input: str
     answer_data: AnswerData
 
-# Endpoint for getting an answer
+# Close the connection pools of the async clients on shutdown
+@app.on_event("shutdown")
+async def shutdown():
+    await close_clients()
+
+# Endpoint for getting an answer, served on the event loop so waiting on the LLM and
+# Elasticsearch does not hold a worker thread
 @app.post("/get-answer")
-def get_answer_endpoint(query: QueryRequest):
-    answer_data = get_answer(query.user_input, query.model_choice, query.search_type)
+async def get_answer_endpoint(query: QueryRequest):
+    answer_data = await get_answer(
+        query.user_input, query.model_choice, query.search_type, query.k, query.num_candidates,
+        query.defer_evaluation, query.rewrite
+    )
+    return answer_data
+
+# Endpoint answering a question and saving the conversation in one request. The conversation is saved
+# after the answer has been sent, so the database write does not delay the response
+@app.post("/ask")
+async def ask_endpoint(query: AskRequest, background_tasks: BackgroundTasks):
+    answer_data = await get_answer(
+        query.user_input, query.model_choice, query.search_type, query.k, query.num_candidates,
+        query.defer_evaluation, query.rewrite
+    )
+    background_tasks.add_task(save_conversation, query.conversation_id, query.user_input, answer_data)
     return answer_data
 
+# Endpoint streaming the answer as Server-Sent Events: 'token' events carry pieces of the answer text as
+# they are generated, a final 'answer' event the answer data. The conversation is saved when an id is given
+@app.post("/stream-answer")
+async def stream_answer_endpoint(query: StreamQueryRequest):
+    async def events():
+        try:
+            async for event, data in stream_answer(
+                query.user_input, query.model_choice, query.search_type, query.k, query.num_candidates,
+                query.defer_evaluation, query.rewrite
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == "answer" and query.conversation_id:
+                    await asyncio.to_thread(save_conversation, query.conversation_id, query.user_input, data)
+        except Exception as e:
+            # The response has started, so the error can only be reported in the stream
+            print(f"Streaming an answer failed: {e!r}")
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Endpoint for saving a conversation
 @app.post("/save-conversation")
 def save_conversation_endpoint(request: ConversationRequest):
@@ -66,6 +126,16 @@ def recent_conversations(limit: int, relevance: str = None):
 def feedback_stats():
     return get_feedback_stats()
 
+# Endpoint to get the hit rates of the in-process caches
+@app.get("/cache-stats")
+def cache_stats():
+    return get_cache_stats()
+
+# Endpoint to get the connection reuse of the LLM provider clients
+@app.get("/connection-stats")
+def connection_stats():
+    return get_connection_stats()
+
 # Optional: A root endpoint for basic health check or welcome
 @app.get("/")
 def read_root():
@@ -0,0 +1,139 @@
+"""
+relevance_worker.py
+
+This module grades answers in the background, so the relevance evaluation (an extra LLM round trip)
+does not delay returning the answer to the user.
+
+Answers are returned with the relevance "PENDING" and queued together with their `answer_id`. Worker
+threads evaluate them and backfill the relevance, explanation and evaluation token counts of the stored
+conversation. The conversation is saved after the answer was returned, by the `/ask` endpoint or in a
+separate request of the client, so an evaluation can finish before its row exists; the update is then
+retried a few times. Answers whose evaluation fails keep the relevance "PENDING" and can be graded later
+by an offline job.
+
+Classes:
+    - RelevanceWorker: A queue of answers graded by background threads.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+PENDING_RELEVANCE = "PENDING"
+PENDING_EXPLANATION = "Relevance evaluation pending"
+
+
+class RelevanceWorker:
+    """
+    Evaluates queued answers on background threads and stores the results.
+
+    Args:
+        evaluate (Callable[[str, str], Tuple[str, str, Dict[str, int]]]): Grades a question and answer,
+            returning the relevance, explanation and token usage, see `chat_functions.evaluate_relevance`.
+        store (Callable[[str, str, str, Dict[str, int]], bool]): Stores the result for an answer id and
+            returns whether the answer was found, see `database.update_relevance`.
+        workers (int): The number of evaluation threads. Defaults to 2.
+        store_retries (int): How often to retry storing a result whose answer is not saved yet. Defaults to 10.
+        retry_delay (float): Seconds between those retries. Defaults to 1.0.
+    """
+
+    def __init__(
+        self,
+        evaluate: Callable[[str, str], Tuple[str, str, Dict[str, int]]],
+        store: Callable[[str, str, str, Dict[str, int]], bool],
+        workers: int = 2,
+        store_retries: int = 10,
+        retry_delay: float = 1.0
+    ) -> None:
+        self.evaluate = evaluate
+        self.store = store
+        self.store_retries = store_retries
+        self.retry_delay = retry_delay
+        self.evaluated = 0
+        self.failed = 0
+        self.unsaved = 0
+
+        self._queue: "queue.Queue[Tuple[str, str, str, Optional[Callable]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"relevance-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self,
+        answer_id: str,
+        question: str,
+        answer: str,
+        on_evaluated: Optional[Callable[[str, str, Dict[str, int]], None]] = None
+    ) -> None:
+        """
+        Queues an answer for evaluation.
+
+        Args:
+            answer_id (str): The id the answer will be saved with.
+            question (str): The question the answer was generated for.
+            answer (str): The generated answer.
+            on_evaluated (Optional[Callable[[str, str, Dict[str, int]], None]]): Called on the worker thread
+                with the relevance, explanation and token usage once the answer is evaluated. Defaults to None.
+        """
+        self._queue.put((answer_id, question, answer, on_evaluated))
+
+    def _run(self) -> None:
+        while True:
+            answer_id, question, answer, on_evaluated = self._queue.get()
+            try:
+                relevance, explanation, tokens = self.evaluate(question, answer)
+            except Exception as e:
+                print(f"Relevance evaluation of answer {answer_id} failed: {e!r}")
+                self._count("failed")
+                continue
+
+            self._count("evaluated")
+            self._store(answer_id, relevance, explanation, tokens, self.store_retries)
+            if on_evaluated is not None:
+                try:
+                    on_evaluated(relevance, explanation, tokens)
+                except Exception as e:
+                    print(f"Handling the relevance evaluation of answer {answer_id} failed: {e!r}")
+
+    def _store(self, answer_id: str, relevance: str, explanation: str, tokens: Dict[str, int], retries: int) -> None:
+        try:
+            stored = self.store(answer_id, relevance, explanation, tokens)
+        except Exception as e:
+            print(f"Storing the relevance of answer {answer_id} failed: {e!r}")
+            stored = False
+
+        if stored:
+            return
+        if retries > 0:
+            # The conversation may not be saved yet, try again later without holding up the worker
+            timer = threading.Timer(
+                self.retry_delay, self._store, (answer_id, relevance, explanation, tokens, retries - 1)
+            )
+            timer.daemon = True
+            timer.start()
+        else:
+            print(f"Answer {answer_id} was never saved, dropping its relevance evaluation")
+            self._count("unsaved")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarises the background evaluations.
+
+        Returns:
+            Dict[str, Any]: The number of answers 'queued', 'evaluated' and 'failed', and of results
+            dropped because their answer was never saved ('unsaved').
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "evaluated": self.evaluated,
+            "failed": self.failed,
+            "unsaved": self.unsaved,
+        }
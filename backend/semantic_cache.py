@@ -0,0 +1,184 @@
+"""
+semantic_cache.py
+
+This module provides an in-process cache looked up by embedding similarity instead of exact keys, used by
+the backend to answer repeated questions that are worded differently without another LLM round trip.
+
+Entries are grouped into scopes, for example by model and search type, and a lookup only matches entries
+of its own scope whose vector has at least `threshold` cosine similarity with the query vector. The cache
+is bounded with least-recently-used eviction and entries expire after a time-to-live.
+
+Cached values are only valid for one version of the underlying data. When a version function is given, a
+background thread polls it and clears the cache whenever the version changes. Until the version is known
+for the first time nothing is cached, as the entries could not be told apart from later versions.
+
+Classes:
+    - SemanticCache: A bounded, expiring cache keyed by vector similarity within a scope.
+"""
+
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SemanticCache:
+    """
+    A thread-safe LRU cache whose lookups match the most similar stored vector of the same scope.
+
+    Args:
+        maxsize (int): The maximum number of entries over all scopes. Zero or less disables the cache.
+        ttl (float): Seconds an entry stays valid. Zero or less disables expiry.
+        threshold (float): The minimum cosine similarity for a lookup to match an entry.
+        version (Optional[Callable[[], Any]]): Returns the current version of the cached data, or raises
+            if it cannot be determined. Defaults to None, no invalidation.
+        check_interval (float): Seconds between version checks. Defaults to 30.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        threshold: float,
+        version: Optional[Callable[[], Any]] = None,
+        check_interval: float = 30.0
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (scope, vector, value, stored at)
+        self._scopes: Dict[Hashable, Dict[int, np.ndarray]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._version_fn = version
+        self._check_interval = check_interval
+        self.version = None
+        if version is not None and maxsize > 0:
+            threading.Thread(target=self._watch_version, name="semantic-cache-version", daemon=True).start()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _remove(self, entry_id: int) -> None:
+        scope = self._entries.pop(entry_id)[0]
+        del self._scopes[scope][entry_id]
+        if not self._scopes[scope]:
+            del self._scopes[scope]
+
+    def get(self, scope: Hashable, vector: np.ndarray) -> Optional[Any]:
+        """
+        Returns the value of the most similar entry in a scope and marks it as recently used.
+
+        Args:
+            scope (Hashable): The scope to search.
+            vector (np.ndarray): The query vector.
+
+        Returns:
+            Optional[Any]: The cached value, or None if no unexpired entry is similar enough.
+        """
+        if not self.enabled:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            now = time.monotonic()
+            candidates = self._scopes.get(scope, {})
+            if self.ttl > 0:
+                for entry_id in [i for i in candidates if now - self._entries[i][3] > self.ttl]:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                candidates = self._scopes.get(scope, {})
+
+            if candidates:
+                ids = list(candidates)
+                similarities = np.stack([candidates[i] for i in ids]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]][2]
+
+            self.misses += 1
+            return None
+
+    def set(self, scope: Hashable, vector: np.ndarray, value: Any) -> None:
+        """
+        Stores a value, evicting the least recently used entries if the cache is full. Nothing is stored
+        while the version of the cached data is not known yet.
+
+        Args:
+            scope (Hashable): The scope of the entry.
+            vector (np.ndarray): The vector the entry is looked up by.
+            value (Any): The value to cache.
+        """
+        if not self.enabled or (self._version_fn is not None and self.version is None):
+            return
+        stored = np.asarray(vector, dtype=np.float32)
+        stored = stored / (np.linalg.norm(stored) or 1.0)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, stored, value, time.monotonic())
+            self._scopes.setdefault(scope, {})[entry_id] = stored
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def _current_version(self) -> Any:
+        try:
+            return self._version_fn()
+        except Exception as e:
+            print(f"Could not determine the version of the cached data: {e!r}")
+            return self.version  # Keep serving the entries until the version is known again
+
+    def _watch_version(self) -> None:
+        while True:
+            version = self._current_version()
+            if version != self.version:
+                if self.version is not None:
+                    self.clear()
+                    self.invalidations += 1
+                self.version = version
+            time.sleep(self._check_interval)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarises the cache usage since it was created.
+
+        Returns:
+            Dict[str, Any]: The 'size', 'maxsize', 'hits', 'misses', 'hit_rate', 'expirations', 'evictions'
+            and 'invalidations'.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
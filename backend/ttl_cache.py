@@ -0,0 +1,108 @@
+"""
+ttl_cache.py
+
+This module provides a small thread-safe in-process cache with least-recently-used eviction and
+time-to-live expiry, used by the backend to avoid recomputing results for repeated requests.
+
+Classes:
+    - TTLCache: A bounded LRU cache whose entries expire after a fixed number of seconds.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries expire `ttl` seconds after they were stored.
+
+    Hits, misses, expirations and evictions are counted so the cache effectiveness can be monitored.
+
+    Args:
+        maxsize (int): The maximum number of entries. The least recently used entry is evicted beyond it.
+        ttl (float): Seconds an entry stays valid. Zero or less disables expiry.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the cached value for a key and marks it as recently used.
+
+        Args:
+            key (Hashable): The cache key.
+
+        Returns:
+            Optional[Any]: The cached value, or None if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to cache.
+        """
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarises the cache usage since it was created.
+
+        Returns:
+            Dict[str, Any]: The 'size', 'maxsize', 'hits', 'misses', 'hit_rate', 'expirations' and 'evictions'.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
@@ -16,13 +16,14 @@ def ask_question():
     user_input = st.session_state.user_input  # Get user input from session state
     if user_input:  # Ensure there's input to process
         query = {
+            "conversation_id": st.session_state.conversation_id,
             "user_input": user_input,
             "model_choice": f"{st.session_state.model_type}/{st.session_state.model_choice}",
             "search_type": st.session_state.search_type
         }
-        # Send request to backend to get answer
+        # Send request to backend to get answer, the backend saves the conversation
         with st.spinner('Processing...'):
-            answer_data = send_request("/get-answer", query, method="POST")
+            answer_data = send_request("/ask", query, method="POST")
 
             # Append the question and answer to conversation history
             st.session_state.conversation_history.append({
@@ -30,14 +31,6 @@ def ask_question():
                 "answer": answer_data['answer']
             })
 
-            # Save conversation to backend
-            save_data = {
-                "conversation_id": st.session_state.conversation_id,
-                "user_input": user_input,
-                "answer_data": answer_data
-            }
-            send_request("/save-conversation", save_data, method="POST")
-
             # Clear user input after asking the question
             st.session_state.user_input = ""
 
@@ -162,7 +155,7 @@ def main():
     with col3:
         st.session_state.search_type = st.selectbox(
             "Select search type:",
-            ["Vector", "Hybrid", "Text"]
+            ["Vector", "Hybrid", "RRF", "Text"]
         )
 
     st.markdown('</div>', unsafe_allow_html=True)